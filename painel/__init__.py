@@ -0,0 +1 @@
+#Pacote com as etapas de dados e agregação usadas pelo dashboard.py
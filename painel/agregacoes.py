@@ -0,0 +1,118 @@
+import numpy as np
+import pandas as pd
+
+from painel.quadros import concatenar
+
+#Dimensões e medidas usadas pelas tabelas-resumo do dashboard
+DIMENSOES = ['city', 'rooms', 'floor', 'furniture', 'animal']
+CUSTOS = ['rent amount (R$)', 'hoa (R$)', 'property tax (R$)', 'fire insurance (R$)']
+MEDIDAS = ['total (R$)', 'area'] + CUSTOS
+#Soma dos quadrados de cada medida, para variância e desvio padrão combináveis
+QUADRADOS = [f'{medida}²' for medida in MEDIDAS]
+
+
+#Rótulos da comparação com a média usados nos gráficos por cidade
+ROTULOS_MEDIA = ('Abaixo da média', 'Acima da média')
+
+
+def classificar_pela_media(valores, media, rotulos=ROTULOS_MEDIA, inclusivo=False):
+  #Classifica cada valor como abaixo ou acima da média de forma vetorizada.
+  #Com inclusivo=True, valores iguais à média contam como abaixo dela
+  valores = np.asarray(valores)
+  abaixo = valores <= media if inclusivo else valores < media
+  return pd.Categorical.from_codes(np.where(abaixo, 0, 1), categories=list(rotulos))
+
+
+def agrupar(dados):
+  #Única passada sobre as linhas: contagem, somas e somas dos quadrados por
+  #combinação de dimensões. Todas as tabelas do dashboard são derivadas deste
+  #resultado, que é pequeno (é o cubo consultado por painel.cubo)
+  quadrados = dados[MEDIDAS].astype('float64') ** 2
+  quadrados.columns = QUADRADOS
+  dados = pd.concat([dados[DIMENSOES + MEDIDAS], quadrados], axis=1)
+  #dropna=False mantém o térreo (andar nulo) nos grupos
+  agrupado = dados.groupby(DIMENSOES, observed=True, dropna=False)
+  grupos = agrupado[MEDIDAS + QUADRADOS].sum()
+  grupos.insert(0, 'count', agrupado.size())
+  return grupos.reset_index()
+
+
+def _somar(grupos, chaves):
+  return grupos.groupby(chaves, observed=True, dropna=False)[['count'] + MEDIDAS + QUADRADOS].sum().reset_index()
+
+
+def combinar_grupos(*grupos):
+  #Soma tabelas de grupos calculadas separadamente (lotes, blocos, partições).
+  #Cada tabela pode ter as próprias categorias (ex.: um lote só de Campinas),
+  #então a união mantém as dimensões categóricas em vez de virar texto
+  return _somar(concatenar(list(grupos)), DIMENSOES)
+
+
+def agregados_de_grupos(grupos):
+  agregados = {}
+
+  #Visão global
+  total_casas = int(grupos['count'].sum())
+  valor_total = grupos['total (R$)'].sum()
+  agregados['total_casas'] = total_casas
+  agregados['valor_medio_geral'] = valor_total / total_casas
+  agregados['metro_quadrado_total'] = valor_total / grupos['area'].sum()
+
+  por_cidade = _somar(grupos, ['city'])
+
+  #Distribuição de imóveis por cidade
+  dados_por_cidade = por_cidade[['city', 'count']].sort_values('count', ascending=False, kind='stable').reset_index(drop=True)
+  dados_por_cidade['percent'] = (dados_por_cidade['count'] / dados_por_cidade['count'].sum()) * 100
+  agregados['dados_por_cidade'] = dados_por_cidade
+
+  #Valor médio do aluguel e do metro quadrado por cidade
+  dados_media_total = por_cidade[['city']].copy()
+  dados_media_total['total (R$)'] = (por_cidade['total (R$)'] / por_cidade['count']).round(2)
+  media_aluguel = dados_media_total['total (R$)'].mean()
+  dados_media_total['color'] = classificar_pela_media(dados_media_total['total (R$)'], media_aluguel)
+  agregados['dados_media_total'] = dados_media_total
+  agregados['media_aluguel'] = media_aluguel
+
+  dados_media = dados_media_total[['city', 'total (R$)']].copy()
+  dados_media['area'] = por_cidade['area'] / por_cidade['count']
+  dados_media['metro_quadrado'] = (dados_media['total (R$)'] / dados_media['area']).round(2)
+  media_metro_quadrado = dados_media['metro_quadrado'].mean()
+  dados_media['color'] = classificar_pela_media(dados_media['metro_quadrado'], media_metro_quadrado)
+  agregados['dados_media'] = dados_media
+  agregados['media_metro_quadrado'] = media_metro_quadrado
+
+  #Valores embutidos no aluguel
+  dados_medios_imbutidos = por_cidade[['city']].copy()
+  for custo in CUSTOS:
+    dados_medios_imbutidos[custo] = (por_cidade[custo] / por_cidade['count']).round(2)
+  agregados['dados_medios_imbutidos'] = dados_medios_imbutidos
+
+  #Aceite de animais por cidade
+  contagem_animais = _somar(grupos, ['city', 'animal'])[['city', 'animal', 'count']]
+  contagem_animais['total'] = contagem_animais.groupby('city', observed=True)['count'].transform('sum')
+  contagem_animais['percent'] = (contagem_animais['count'] / contagem_animais['total']) * 100
+  agregados['contagem_animais'] = contagem_animais
+
+  #Mobília por cidade (contagem e preço médio)
+  mobilia = _somar(grupos, ['city', 'furniture'])
+  dados_mobilia_cidades = mobilia[['city', 'furniture', 'count']].copy()
+  dados_mobilia_cidades['preco_medio'] = (mobilia['total (R$)'] / mobilia['count']).round(2)
+  agregados['dados_mobilia_cidades'] = dados_mobilia_cidades
+
+  #Quartos por cidade
+  quartos = _somar(grupos, ['city', 'rooms'])
+  dados_quartos = quartos[['city', 'rooms', 'count']].copy()
+  dados_quartos['valor_medio'] = (quartos['total (R$)'] / quartos['count']).round(2)
+  dados_quartos['rooms'] = dados_quartos['rooms'].astype(str)
+  agregados['dados_quartos'] = dados_quartos
+  agregados['quantidade_quartos'] = quartos['rooms'].nunique()
+
+  #Andar por cidade (valor médio por célula do mapa de calor)
+  andares = _somar(grupos, ['city', 'floor']).sort_values(['city', 'floor'], na_position='first')
+  dados_andar = andares[['city']].copy()
+  dados_andar['andar'] = andares['floor'].astype('string').fillna('-')
+  dados_andar['count'] = andares['count']
+  dados_andar['valor_medio'] = (andares['total (R$)'] / andares['count']).round(2)
+  agregados['dados_andar'] = dados_andar.reset_index(drop=True)
+
+  return agregados
@@ -0,0 +1,293 @@
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from painel.agregacoes import CUSTOS, agregados_de_grupos
+from painel.cache import CacheLRU
+from painel.cidades import agregados_por_cidade
+from painel.dados import ARQUIVO_DADOS, impressao_digital
+from painel.indice import IndiceFiltros
+from painel.ingestao import IngestaoIncremental
+from painel.precomputo import abrir_armazem, ultimo_armazem
+
+#Serviço HTTP com os números por cidade exibidos no dashboard (quantidade,
+#valor médio, preço do m², custos embutidos e proporções de aceite de animais
+#e de mobília), para outros serviços não precisarem raspar o Streamlit:
+#
+#  python -m painel.api --porta 8502
+#  curl 'http://127.0.0.1:8502/agregados?city=Campinas&rooms=2,3&animal=acept'
+#
+#Os filtros são os da barra lateral: city, animal e furniture (repetidos ou
+#separados por vírgula) e as faixas rooms e total ("minimo,maximo"). As
+#tabelas vêm do mesmo cálculo do dashboard (armazém pré-calculado, grupos da
+#ingestão ou cálculo por cidade), e cada resposta fica em cache já
+#serializada e comprimida, com um ETag: uma requisição com If-None-Match
+#igual recebe 304 sem corpo. Lotes novos mudam a versão dos dados e,
+#com ela, o ETag
+
+#Quantidade de respostas serializadas mantidas em cache
+LIMITE_RESPOSTAS = 256
+#Intervalo mínimo entre verificações da pasta de lotes, em segundos
+INTERVALO_LOTES = 5.0
+#Filtros aceitos na URL, com o nome da coluna correspondente
+FILTROS_URL = {'city': 'city', 'animal': 'animal', 'furniture': 'furniture', 'rooms': 'rooms', 'total': 'total (R$)'}
+
+registro = logging.getLogger('painel.api')
+
+
+class FiltroInvalido(ValueError):
+  pass
+
+
+def _nativo(valor):
+  #Tipos do numpy/pandas que o json não serializa sozinho
+  if isinstance(valor, np.generic):
+    return valor.item()
+  raise TypeError(f'Tipo não serializável: {type(valor).__name__}')
+
+
+def aceita_gzip(cabecalho):
+  #Se o Accept-Encoding aceita gzip: a codificação (ou "*", quando gzip não
+  #aparece) listada com q maior que zero. "gzip;q=0" recusa
+  qualidades = {}
+  for item in cabecalho.split(','):
+    codificacao, *parametros = [parte.strip() for parte in item.split(';')]
+    qualidade = 1.0
+    for parametro in parametros:
+      nome, _, valor = parametro.partition('=')
+      if nome.strip().lower() == 'q':
+        try:
+          qualidade = float(valor)
+        except ValueError:
+          qualidade = 0.0
+    if codificacao:
+      qualidades[codificacao.lower()] = qualidade
+  for codificacao in ('gzip', 'x-gzip', '*'):
+    if codificacao in qualidades:
+      return qualidades[codificacao] > 0
+  return False
+
+
+def resumo_cidades(agregados):
+  #Uma entrada por cidade com os números das tabelas-resumo do dashboard
+  cidades = {}
+  for linha in agregados['dados_por_cidade'].itertuples(index=False):
+    cidades[linha.city] = {'city': linha.city, 'imoveis': int(linha.count), 'percentual': float(linha.percent)}
+  for linha in agregados['dados_media'].to_dict('records'):
+    cidades[linha['city']].update(valor_medio=linha['total (R$)'], area_media=linha['area'],
+                                  metro_quadrado=linha['metro_quadrado'])
+  for linha in agregados['dados_medios_imbutidos'].to_dict('records'):
+    cidades[linha['city']]['custos'] = {custo: linha[custo] for custo in CUSTOS}
+  for linha in agregados['contagem_animais'].to_dict('records'):
+    cidades[linha['city']].setdefault('animais', {})[linha['animal']] = linha['percent']
+  mobilia = agregados['dados_mobilia_cidades']
+  totais = mobilia.groupby('city', observed=True)['count'].transform('sum')
+  for linha, total in zip(mobilia.to_dict('records'), totais):
+    cidades[linha['city']].setdefault('mobilia', {})[linha['furniture']] = {
+      'percentual': linha['count'] / total * 100, 'valor_medio': linha['preco_medio']}
+  return list(cidades.values())
+
+
+class ServicoAgregados:
+  #Estado compartilhado entre as threads do servidor: dados carregados, índice
+  #dos filtros e respostas já serializadas
+
+  def __init__(self, caminho=ARQUIVO_DADOS, lotes=None):
+    armazem = ultimo_armazem(impressao_digital(caminho))
+    self.ingestao = (armazem.ingestao(lotes) if armazem is not None
+                     else IngestaoIncremental.de_arquivo(caminho, lotes=lotes))
+    #Respostas por (versão dos dados, filtros), com descarte das menos usadas
+    self.respostas = CacheLRU(LIMITE_RESPOSTAS)
+    self._trava = threading.Lock()
+    #Uma trava por resposta em cálculo: requisições simultâneas da mesma
+    #consulta esperam o primeiro cálculo em vez de repeti-lo
+    self._calculando = {}
+    self._verificado = 0.0
+    self.versao = None
+    self.atualizar()
+
+  def atualizar(self):
+    #Acrescenta lotes novos no máximo a cada INTERVALO_LOTES segundos. Quando
+    #a versão dos dados muda, troca de uma vez a versão, a tabela, o índice e
+    #o armazém, que as requisições leem juntos. Se algo falhar no meio, a
+    #próxima requisição tenta de novo em vez de esperar o intervalo
+    if time.monotonic() - self._verificado < INTERVALO_LOTES:
+      return self.versao
+    with self._trava:
+      if time.monotonic() - self._verificado < INTERVALO_LOTES:
+        return self.versao
+      self.ingestao.atualizar()
+      if self.versao is None or self.ingestao.impressao != self.versao[0]:
+        tabela = self.ingestao.tabela
+        self.versao = (self.ingestao.impressao, tabela, IndiceFiltros(tabela), abrir_armazem(self.ingestao.impressao),
+                       self.ingestao.grupos)
+      self._verificado = time.monotonic()
+      return self.versao
+
+  @staticmethod
+  def filtros(consulta, indice):
+    #Filtros da URL, normalizados como no dashboard
+    filtros = {}
+    for nome, valores in parse_qs(consulta).items():
+      if nome not in FILTROS_URL:
+        raise FiltroInvalido(f'Filtro desconhecido: {nome}')
+      coluna = FILTROS_URL[nome]
+      valores = [valor for texto in valores for valor in texto.split(',') if valor]
+      if coluna in ('rooms', 'total (R$)'):
+        try:
+          minimo, maximo = (int(valor) for valor in valores)
+        except ValueError:
+          raise FiltroInvalido(f'{nome} espera "minimo,maximo"') from None
+        filtros[coluna] = (minimo, maximo)
+      else:
+        desconhecidos = set(valores) - set(indice.valores(coluna))
+        if desconhecidos:
+          raise FiltroInvalido(f'Valores desconhecidos em {nome}: {", ".join(sorted(desconhecidos))}')
+        filtros[coluna] = valores
+    return tuple(indice.normalizar(filtros).items())
+
+  @staticmethod
+  def agregados(versao, filtros):
+    #Mesma ordem de fontes do dashboard (carregar_agregados)
+    _, tabela, indice, armazem, grupos = versao
+    agregados = armazem.agregados(filtros) if armazem is not None else None
+    if agregados is not None:
+      return agregados
+    if not filtros:
+      return agregados_de_grupos(grupos)
+    rotulo = tuple(filtro for filtro in filtros if filtro[0] != 'city')
+    tabela = tabela.filtrar(indice.mascara(dict(filtros)), rotulo)
+    return agregados_por_cidade(tabela) if len(tabela) else None
+
+  def resposta(self, consulta):
+    #(corpo, corpo comprimido, ETag) da consulta, calculados uma única vez
+    #por versão dos dados e combinação de filtros
+    versao = self.atualizar()
+    impressao, _, indice, _, _ = versao
+    filtros = self.filtros(consulta, indice)
+    chave = (impressao, filtros)
+    resposta = self.respostas.obter(chave)
+    if resposta is not None:
+      return resposta
+    with self._trava:
+      trava = self._calculando.setdefault(chave, threading.Lock())
+    with trava:
+      resposta = self.respostas.obter(chave)
+      if resposta is None:
+        resposta = self.respostas.guardar(chave, self._serializar(versao, filtros))
+      with self._trava:
+        self._calculando.pop(chave, None)
+    return resposta
+
+  def _serializar(self, versao, filtros):
+    agregados = self.agregados(versao, filtros)
+    documento = {'versao': versao[0], 'filtros': {coluna: list(valor) for coluna, valor in filtros}}
+    if agregados is None:
+      documento.update(imoveis=0, cidades=[])
+    else:
+      documento.update(imoveis=agregados['total_casas'], valor_medio=agregados['valor_medio_geral'],
+                       metro_quadrado=agregados['metro_quadrado_total'], cidades=resumo_cidades(agregados))
+    corpo = json.dumps(documento, ensure_ascii=False, default=_nativo).encode('utf-8')
+    etag = 'W/"' + hashlib.sha1(corpo).hexdigest()[:20] + '"'
+    return corpo, gzip.compress(corpo, compresslevel=6, mtime=0), etag
+
+
+def resposta_erro(codigo, mensagem):
+  #(código, corpo, cabeçalhos) de uma resposta de erro em JSON
+  corpo = json.dumps({'erro': mensagem}, ensure_ascii=False).encode('utf-8')
+  return codigo, corpo, [('Content-Type', 'application/json; charset=utf-8')]
+
+
+class Manipulador(BaseHTTPRequestHandler):
+  #HTTP/1.1 para manter as conexões abertas entre requisições
+  protocol_version = 'HTTP/1.1'
+  servico = None
+
+  def _enviar(self, codigo, corpo=b'', cabecalhos=()):
+    self.send_response(codigo)
+    for nome, valor in cabecalhos:
+      self.send_header(nome, valor)
+    self.send_header('Content-Length', str(len(corpo)))
+    self.end_headers()
+    if self.command != 'HEAD':
+      self.wfile.write(corpo)
+
+  def do_GET(self):
+    #Qualquer falha vira uma resposta de erro (e a conexão continua aberta)
+    try:
+      resposta = self._responder(urlsplit(self.path))
+    except FiltroInvalido as erro:
+      resposta = resposta_erro(400, str(erro))
+    except Exception:
+      registro.exception('Erro ao responder %s', self.path)
+      resposta = resposta_erro(500, 'Erro interno do servidor')
+    self._enviar(*resposta)
+
+  def _responder(self, endereco):
+    #(código, corpo, cabeçalhos) da requisição
+    if endereco.path == '/saude':
+      impressao, tabela = self.servico.atualizar()[:2]
+      corpo = json.dumps({'versao': impressao, 'imoveis': len(tabela)}).encode('utf-8')
+      return 200, corpo, [('Content-Type', 'application/json'), ('Cache-Control', 'no-store')]
+    if endereco.path != '/agregados':
+      return resposta_erro(404, f'Caminho desconhecido: {endereco.path}')
+    corpo, comprimido, etag = self.servico.resposta(endereco.query)
+
+    cabecalhos = [('ETag', etag), ('Cache-Control', 'no-cache'), ('Vary', 'Accept-Encoding')]
+    #ETag fraco: vale para a versão comprimida e para a não comprimida
+    informados = [valor.strip().removeprefix('W/') for valor in self.headers.get('If-None-Match', '').split(',')]
+    if etag.removeprefix('W/') in informados or '*' in informados:
+      return 304, b'', cabecalhos
+    cabecalhos.append(('Content-Type', 'application/json; charset=utf-8'))
+    if aceita_gzip(self.headers.get('Accept-Encoding', '')):
+      cabecalhos.append(('Content-Encoding', 'gzip'))
+      corpo = comprimido
+    return 200, corpo, cabecalhos
+
+  do_HEAD = do_GET
+
+  def log_message(self, formato, *argumentos):
+    registro.debug(formato, *argumentos)
+
+
+class ServidorAgregados(ThreadingHTTPServer):
+  #Uma thread por conexão. A fila de conexões pendentes é maior que a padrão
+  #(5), que recusaria rajadas de centenas de clientes conectando juntos
+  request_queue_size = 1024
+  daemon_threads = True
+
+
+def servir(host='127.0.0.1', porta=8502, caminho=ARQUIVO_DADOS, lotes=None):
+  Manipulador.servico = ServicoAgregados(caminho, lotes)
+  return ServidorAgregados((host, porta), Manipulador)
+
+
+def main(argumentos=None):
+  parser = argparse.ArgumentParser(description='Serviço HTTP com os agregados por cidade do dashboard.')
+  parser.add_argument('--host', default='127.0.0.1')
+  parser.add_argument('--porta', type=int, default=8502)
+  parser.add_argument('--arquivo', default=ARQUIVO_DADOS, help='CSV do conjunto de dados')
+  parser.add_argument('--lotes', help='pasta dos lotes de novos imóveis (padrão: a do arquivo de dados)')
+  opcoes = parser.parse_args(argumentos)
+  logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(message)s')
+
+  servidor = servir(opcoes.host, opcoes.porta, opcoes.arquivo, opcoes.lotes)
+  registro.info('Servindo em http://%s:%d/agregados', *servidor.server_address[:2])
+  try:
+    servidor.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    servidor.server_close()
+
+
+if __name__ == '__main__':
+  main()
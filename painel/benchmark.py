@@ -0,0 +1,156 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from painel.agregacoes import DIMENSOES, MEDIDAS, agregados_de_grupos, agrupar
+from painel.cidades import agrupar_por_cidade
+from painel.dados import TabelaDados, adicionar_derivadas, ler_csv, ler_dados_brutos, remove_outliers
+from painel.graficos import preparar_figuras
+from painel.histogramas import CALCULOS_HISTOGRAMAS
+from painel.ingestao import IngestaoIncremental
+from painel.motores import MotorDuckDB, duckdb
+from painel.ofertas import IndiceOfertas
+from painel.outliers import CAMPOS_OUTLIERS, LimitesOutliers
+
+#Benchmark das etapas do dashboard com dados sintéticos no esquema do
+#houses_to_rent_v2.csv. Roda sem navegador e sem Streamlit:
+#
+#  python -m painel.benchmark --linhas 10000 100000 1000000 10000000
+#
+#Para cada tamanho, mede tempo e pico de memória (tracemalloc) da leitura,
+#da remoção de outliers, de cada agregação e da construção e serialização
+#JSON de cada figura. Com o duckdb instalado, mede também a carga completa
+#(outliers, grupos e linhas) feita por consultas no motor DuckDB.
+
+CIDADES = ['São Paulo', 'Rio de Janeiro', 'Belo Horizonte', 'Porto Alegre', 'Campinas']
+PESOS_CIDADES = [0.55, 0.14, 0.12, 0.11, 0.08]
+#Valor aproximado do aluguel por m² em cada cidade
+ALUGUEL_M2 = np.array([35.0, 30.0, 22.0, 20.0, 18.0])
+
+
+def gerar_imoveis(linhas, semente=0):
+  aleatorio = np.random.default_rng(semente)
+  cidade = aleatorio.choice(len(CIDADES), size=linhas, p=PESOS_CIDADES)
+  area = np.maximum(aleatorio.lognormal(np.log(90), 0.8, linhas), 11).astype(np.int64)
+  #Uma pequena parte com áreas absurdas, para o filtro de outliers ter trabalho
+  area[aleatorio.random(linhas) < 0.005] *= 50
+  quartos = np.clip(1 + aleatorio.poisson(1.3, linhas), 1, 10)
+  aluguel = np.maximum(area * ALUGUEL_M2[cidade] * aleatorio.lognormal(0, 0.35, linhas), 450).astype(np.int64)
+  condominio = np.where(aleatorio.random(linhas) < 0.3, 0, area * 9 * aleatorio.lognormal(0, 0.5, linhas)).astype(np.int64)
+  iptu = (aluguel * 0.1 * aleatorio.lognormal(0, 0.6, linhas)).astype(np.int64)
+  seguro = (aluguel * 0.013 + 3).astype(np.int64)
+  andar = np.where(aleatorio.random(linhas) < 0.25, '-', aleatorio.integers(1, 30, linhas).astype(str))
+  return pd.DataFrame({
+    'city': np.array(CIDADES)[cidade],
+    'area': area,
+    'rooms': quartos,
+    'bathroom': np.clip(quartos + aleatorio.integers(-1, 2, linhas), 1, 10),
+    'parking spaces': aleatorio.poisson(1.2, linhas),
+    'floor': andar,
+    'animal': np.where(aleatorio.random(linhas) < 0.78, 'acept', 'not acept'),
+    'furniture': np.where(aleatorio.random(linhas) < 0.25, 'furnished', 'not furnished'),
+    'hoa (R$)': condominio,
+    'rent amount (R$)': aluguel,
+    'property tax (R$)': iptu,
+    'fire insurance (R$)': seguro,
+    'total (R$)': condominio + aluguel + iptu + seguro,
+  })
+
+
+class Medidor:
+  #Registra tempo e pico de memória de cada etapa. O tracemalloc deixa o
+  #código bem mais lento, então o pico de memória é medido em uma segunda
+  #execução da etapa e o tempo vem da execução sem rastreamento
+
+  def __init__(self, memoria=True):
+    self.memoria = memoria
+    self.resultados = []
+
+  def medir(self, etapa, funcao, *argumentos, repetir=True):
+    #repetir=False para etapas com efeito colateral (ex.: gravar o cache)
+    inicio = time.perf_counter()
+    resultado = funcao(*argumentos)
+    tempo = time.perf_counter() - inicio
+    pico = None
+    if self.memoria and repetir:
+      tracemalloc.start()
+      base = tracemalloc.get_traced_memory()[0]
+      funcao(*argumentos)
+      pico = tracemalloc.get_traced_memory()[1] - base
+      tracemalloc.stop()
+    self.resultados.append({'etapa': etapa, 'tempo_ms': tempo * 1000, 'pico_mb': None if pico is None else pico / 2 ** 20})
+    return resultado
+
+
+def executar(linhas, semente=0, memoria=True):
+  medidor = Medidor(memoria)
+  with tempfile.TemporaryDirectory() as pasta:
+    caminho = os.path.join(pasta, 'houses_to_rent_v2.csv')
+    gerar_imoveis(linhas, semente).to_csv(caminho, index=False)
+
+    medidor.medir('carregar_dados (csv)', ler_csv, caminho)
+    medidor.medir('carregar_dados (parquet, gravação)', ler_dados_brutos, caminho, repetir=False)
+    brutos = medidor.medir('carregar_dados (parquet)', ler_dados_brutos, caminho)
+    if duckdb is not None:
+      medidor.medir('carga completa (motor duckdb)', IngestaoIncremental.de_motor, MotorDuckDB(caminho), 'benchmark')
+
+    #Remoção encadeada (uma coluna por vez) para comparação com a de uma passada
+    dados = medidor.medir('remove_outliers (area)', remove_outliers, brutos, 'area')
+    medidor.medir('remove_outliers (total)', remove_outliers, dados, 'total (R$)')
+    medidor.medir('outliers: limites por cidade', LimitesOutliers.calcular, brutos, CAMPOS_OUTLIERS, 'city')
+    limites = medidor.medir('outliers: limites (uma passada)', LimitesOutliers.calcular, brutos, CAMPOS_OUTLIERS, None)
+    dados = medidor.medir('outliers: máscara', limites.filtrar, brutos)
+    tabela = TabelaDados(medidor.medir('adicionar_derivadas', adicionar_derivadas, dados))
+
+    grupos = medidor.medir('agregação: agrupar', agrupar, tabela.colunas(*DIMENSOES, *MEDIDAS))
+    agregados = medidor.medir('agregação: tabelas-resumo', agregados_de_grupos, grupos)
+    medidor.medir('agregação: agrupar por cidade', agrupar_por_cidade, tabela)
+    histogramas = {nome: medidor.medir(f'agregação: {nome}', calculo, tabela)
+                   for nome, calculo in CALCULOS_HISTOGRAMAS.items()}
+
+    ofertas = medidor.medir('busca: índice de ofertas', IndiceOfertas, tabela)
+    restricoes = {'city': ['São Paulo'], 'rooms': (3, None), 'parking spaces': (2, None), 'animal': 'acept'}
+    medidor.medir('busca: melhores (preço do m²)', lambda: ofertas.melhores(10, **restricoes))
+    medidor.medir('busca: melhores (pontuação)',
+                  lambda: ofertas.melhores(10, {'preco_metro_quadrado': 1, 'area': -0.5}, **restricoes))
+
+    for nome, (funcao, *argumentos) in preparar_figuras(tabela, agregados, histogramas).items():
+      figura = medidor.medir(f'figura: {nome}', funcao, *argumentos)
+      medidor.medir(f'json: {nome}', figura.to_json)
+  return medidor.resultados
+
+
+def main(argumentos=None):
+  parser = argparse.ArgumentParser(description='Benchmark das etapas do dashboard com dados sintéticos.')
+  parser.add_argument('--linhas', type=int, nargs='+', default=[10_000, 100_000, 1_000_000],
+                      help='tamanhos dos conjuntos sintéticos (ex.: 10000 100000 1000000 10000000)')
+  parser.add_argument('--semente', type=int, default=0)
+  parser.add_argument('--sem-memoria', action='store_true',
+                      help='não mede o pico de memória (evita executar cada etapa duas vezes)')
+  parser.add_argument('--saida', help='arquivo JSON com os resultados')
+  opcoes = parser.parse_args(argumentos)
+
+  relatorio = {}
+  for linhas in opcoes.linhas:
+    resultados = executar(linhas, opcoes.semente, memoria=not opcoes.sem_memoria)
+    relatorio[linhas] = resultados
+    print(f'\n{linhas:,} linhas')
+    print(f'{"etapa":<50} {"tempo (ms)":>12} {"pico (MB)":>10}')
+    for resultado in resultados:
+      pico = '-' if resultado['pico_mb'] is None else f'{resultado["pico_mb"]:.1f}'
+      print(f'{resultado["etapa"]:<50} {resultado["tempo_ms"]:>12.1f} {pico:>10}')
+    print(f'{"total":<50} {sum(r["tempo_ms"] for r in resultados):>12.1f}')
+
+  if opcoes.saida:
+    with open(opcoes.saida, 'w', encoding='utf-8') as arquivo:
+      json.dump(relatorio, arquivo, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+  main()
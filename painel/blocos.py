@@ -0,0 +1,65 @@
+import numpy as np
+
+from painel.agregacoes import DIMENSOES, MEDIDAS, agrupar, combinar_grupos
+from painel.dados import ARQUIVO_DADOS, adicionar_derivadas, ler_csv_em_blocos
+from painel.outliers import CAMPOS_OUTLIERS, POR_OUTLIERS, EsbocosOutliers
+from painel.quadros import concatenar
+
+#Carga fora da memória para arquivos maiores que a RAM disponível. O CSV é
+#lido em blocos e nunca fica inteiro na memória:
+#  1ª passada: esboços de quantis de todas as colunas de outliers (um por
+#              coluna e por grupo, quando os limites são por cidade), que
+#              dão os limites e depois recebem os lotes acrescentados;
+#  2ª passada: grupos (contagens e somas) das linhas aceitas e uma amostra
+#              uniforme de tamanho limitado para os gráficos por linha.
+#Com limites e esboços já conhecidos (gravados em uma carga anterior), a 1ª
+#passada não é feita.
+
+TAMANHO_BLOCO = 200_000
+LIMITE_AMOSTRA = 200_000
+
+
+def _amostrar(amostra, bloco, limite, aleatorio):
+  #Amostragem "bottom-k": cada linha recebe uma chave aleatória e ficam as
+  #"limite" menores chaves, o que equivale a uma amostra uniforme sem reposição
+  bloco = bloco.assign(_chave=aleatorio.random(len(bloco)))
+  if amostra is not None:
+    bloco = concatenar([amostra, bloco])
+  if len(bloco) > limite:
+    bloco = bloco.nsmallest(limite, '_chave')
+  return bloco
+
+
+def ler_em_blocos(caminho=ARQUIVO_DADOS, tamanho_bloco=TAMANHO_BLOCO, limite_amostra=LIMITE_AMOSTRA, semente=0,
+                  limites=None, esbocos=None):
+  if esbocos is None:
+    esbocos = EsbocosOutliers(CAMPOS_OUTLIERS, POR_OUTLIERS)
+    for bloco in ler_csv_em_blocos(caminho, tamanho_bloco):
+      esbocos.adicionar(bloco)
+  if limites is None:
+    limites = esbocos.limites()
+
+  aleatorio = np.random.default_rng(semente)
+  grupos = []
+  amostra = None
+  soma_preco = 0.0
+  linhas = 0
+  for bloco in ler_csv_em_blocos(caminho, tamanho_bloco):
+    bloco = limites.filtrar(bloco)
+    grupos.append(agrupar(bloco[DIMENSOES + MEDIDAS]))
+    soma_preco += float((bloco['total (R$)'] / bloco['area']).sum())
+    linhas += len(bloco)
+    amostra = _amostrar(amostra, bloco, limite_amostra, aleatorio)
+    #Junta os grupos periodicamente para manter a lista pequena
+    if len(grupos) >= 16:
+      grupos = [combinar_grupos(*grupos)]
+
+  amostra = amostra.sort_values('_chave').drop(columns='_chave').reset_index(drop=True)
+  return {
+    'limites': limites,
+    'esbocos': esbocos,
+    'grupos': combinar_grupos(*grupos),
+    'amostra': adicionar_derivadas(amostra, soma_preco / max(linhas, 1)),
+    'soma_preco': soma_preco,
+    'linhas': linhas,
+  }
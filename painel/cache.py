@@ -0,0 +1,28 @@
+import threading
+from collections import OrderedDict
+
+#Cache em memória com descarte dos itens menos usados (LRU), seguro para uso
+#entre threads. Usado pelo cache de resultados por cidade e pelo cache de
+#respostas do serviço de agregados
+
+
+class CacheLRU:
+
+  def __init__(self, limite):
+    self.limite = limite
+    self._resultados = OrderedDict()
+    self._trava = threading.Lock()
+
+  def obter(self, chave):
+    with self._trava:
+      if chave in self._resultados:
+        self._resultados.move_to_end(chave)
+        return self._resultados[chave]
+    return None
+
+  def guardar(self, chave, resultado):
+    with self._trava:
+      self._resultados[chave] = resultado
+      while len(self._resultados) > self.limite:
+        self._resultados.popitem(last=False)
+    return resultado
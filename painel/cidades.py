@@ -0,0 +1,73 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from painel.agregacoes import DIMENSOES, MEDIDAS, agregados_de_grupos, agrupar
+from painel.cache import CacheLRU
+
+#Cálculos particionados por cidade. As linhas são divididas por cidade, cada
+#parte é calculada em paralelo e os resultados são unidos depois. Quando a
+#tabela conhece a versão de cada cidade (TabelaDados.versoes), o resultado de
+#cada cidade fica em cache: um lote novo de uma cidade invalida apenas os
+#resultados dela, e selecionar cidades na barra lateral reaproveita as partes
+#já calculadas.
+#
+#As partes são calculadas em threads: boa parte do trabalho (ordenação,
+#busca binária e contagens do numpy/pandas) libera o GIL, e as threads
+#compartilham a tabela sem copiá-la para outros processos
+
+TRABALHADORES = int(os.environ.get('DASHBOARD_TRABALHADORES', min(8, os.cpu_count() or 1)))
+#Quantidade máxima de resultados por cidade mantidos em cache
+LIMITE_CACHE = 1024
+
+_executor = ThreadPoolExecutor(TRABALHADORES, thread_name_prefix='cidades')
+
+
+#Resultados por (cálculo, cidade, versão da cidade, parâmetros), compartilhados
+#entre sessões e threads
+cache_cidades = CacheLRU(LIMITE_CACHE)
+
+
+def por_cidade(tabela, nome, colunas, calcular, *parametros):
+  #Aplica calcular(parte, *parametros) às linhas de cada cidade (somente com
+  #as colunas indicadas) e devolve {cidade: resultado}, na ordem das
+  #categorias. Os parâmetros entram na chave do cache e devem ser imutáveis
+  #(tuplas, números, textos)
+  cidades = tabela.coluna('city')
+  presentes = np.flatnonzero(np.bincount(cidades.cat.codes.to_numpy(), minlength=len(cidades.cat.categories)))
+  cidades = [cidades.cat.categories[codigo] for codigo in presentes]
+  chaves = {}
+  resultados = {}
+  if tabela.versoes is not None:
+    chaves = {cidade: (nome, cidade, tabela.versoes.get(cidade), parametros) for cidade in cidades}
+    resultados = {cidade: cache_cidades.obter(chave) for cidade, chave in chaves.items()}
+    resultados = {cidade: resultado for cidade, resultado in resultados.items() if resultado is not None}
+
+  faltantes = [cidade for cidade in cidades if cidade not in resultados]
+  if faltantes:
+    partes = tabela.particionar('city', colunas)
+    futuros = {cidade: _executor.submit(calcular, partes[cidade], *parametros) for cidade in faltantes}
+    for cidade, futuro in futuros.items():
+      resultados[cidade] = futuro.result()
+      if cidade in chaves:
+        cache_cidades.guardar(chaves[cidade], resultados[cidade])
+  return {cidade: resultados[cidade] for cidade in cidades}
+
+
+def _agrupar_parte(parte):
+  return agrupar(parte.colunas(*DIMENSOES, *MEDIDAS))
+
+
+def agrupar_por_cidade(tabela):
+  #Mesmo resultado de agrupar(), com os grupos de cada cidade calculados à
+  #parte (as cidades não se misturam, então basta concatenar)
+  partes = por_cidade(tabela, 'grupos', DIMENSOES + MEDIDAS, _agrupar_parte)
+  if not partes:
+    return agrupar(tabela.colunas(*DIMENSOES, *MEDIDAS))
+  return pd.concat(partes.values(), ignore_index=True)
+
+
+def agregados_por_cidade(tabela):
+  return agregados_de_grupos(agrupar_por_cidade(tabela))
@@ -0,0 +1,201 @@
+import argparse
+import re
+
+import numpy as np
+import pandas as pd
+
+from painel.agregacoes import DIMENSOES, MEDIDAS, QUADRADOS
+from painel.dados import ARQUIVO_DADOS, caminho_cache, gravar_artefato, impressao_digital, ler_artefato
+from painel.outliers import ASSINATURA_OUTLIERS
+
+#Cubo de medidas combináveis (contagem, soma e soma dos quadrados de cada
+#medida) por cidade x quartos x andar x mobília x animais. É a própria tabela
+#de grupos mantida pela ingestão, gravada ao lado do conjunto de dados para
+#ser reaproveitada entre reinícios. Qualquer agregação ou detalhamento sobre
+#essas dimensões sai do cubo, sem voltar às linhas:
+#
+#  cubo.resumo(city='Campinas', furniture='furnished', rooms=3, floor=(11, None))
+#  cubo.consultar(por=['city', 'rooms'], animal='acept')
+#
+#Condições por dimensão: um valor, uma lista de valores ou uma faixa
+#(minimo, maximo) inclusiva, com None para o lado aberto. No andar, None
+#seleciona o térreo.
+#
+#Pela linha de comando, lendo apenas o cubo gravado e os lotes de novos
+#imóveis acrescentados depois da carga:
+#
+#  python -m painel.cubo city=Campinas furniture=furnished rooms=3 "floor>10"
+
+
+def caminho_cubo(caminho=ARQUIVO_DADOS, impressao=None):
+  #Os grupos dependem da regra de outliers, que entra no nome do arquivo
+  return caminho_cache(caminho, impressao or impressao_digital(caminho), f'cubo-{ASSINATURA_OUTLIERS}')
+
+
+def ler_grupos(caminho=ARQUIVO_DADOS, impressao=None):
+  #Grupos gravados para esta versão do arquivo, ou None
+  grupos = ler_artefato(caminho_cubo(caminho, impressao))
+  #Arquivos de versões antigas, sem as somas dos quadrados, são refeitos
+  return grupos if grupos is not None and set(QUADRADOS) <= set(grupos.columns) else None
+
+
+def gravar_grupos(grupos, caminho=ARQUIVO_DADOS, impressao=None):
+  gravar_artefato(grupos, caminho_cubo(caminho, impressao))
+
+
+def estatisticas(contagem, somas, quadrados):
+  #Média e desvio padrão amostral a partir de contagem, soma e soma dos
+  #quadrados (arrays com uma coluna por medida)
+  contagem = np.asarray(contagem, dtype=float)[..., None]
+  with np.errstate(divide='ignore', invalid='ignore'):
+    media = somas / contagem
+    variancia = np.maximum(quadrados - somas * media, 0) / (contagem - 1)
+    desvio = np.where(contagem > 1, np.sqrt(variancia), np.nan)
+  return media, desvio
+
+
+class Cubo:
+
+  def __init__(self, grupos):
+    self.grupos = grupos
+    self.dimensoes = {}
+    for dimensao in DIMENSOES:
+      serie = grupos[dimensao]
+      if not isinstance(serie.dtype, pd.CategoricalDtype) and not pd.api.types.is_numeric_dtype(serie.dtype):
+        #Dimensão em texto (ex.: grupos de outra origem): tratada como categórica
+        serie = serie.astype('category')
+      if isinstance(serie.dtype, pd.CategoricalDtype):
+        codigos = {valor: codigo for codigo, valor in enumerate(serie.cat.categories)}
+        self.dimensoes[dimensao] = (serie.cat.codes.to_numpy(), codigos)
+      else:
+        self.dimensoes[dimensao] = (serie.to_numpy(dtype=float, na_value=np.nan), None)
+    self.contagem = grupos['count'].to_numpy(dtype=float)
+    self.somas = grupos[MEDIDAS].to_numpy(dtype=float)
+    self.quadrados = grupos[QUADRADOS].to_numpy(dtype=float)
+
+  def __len__(self):
+    return len(self.contagem)
+
+  def mascara(self, **filtros):
+    #Células do cubo que atendem a todas as condições
+    mascara = np.ones(len(self), dtype=bool)
+    for dimensao, condicao in filtros.items():
+      valores, codigos = self.dimensoes[dimensao]
+      if isinstance(condicao, tuple):
+        minimo, maximo = condicao
+        if minimo is not None:
+          mascara &= valores >= minimo
+        if maximo is not None:
+          mascara &= valores <= maximo
+        continue
+      if not isinstance(condicao, (list, set, frozenset)):
+        #Um único valor: comparação direta, mais rápida que o isin
+        if codigos is not None:
+          mascara &= valores == codigos.get(condicao, -2)
+        else:
+          mascara &= np.isnan(valores) if condicao is None else valores == condicao
+        continue
+      if codigos is not None:
+        mascara &= np.isin(valores, [codigos[valor] for valor in condicao if valor in codigos])
+      else:
+        selecao = np.isin(valores, [valor for valor in condicao if valor is not None])
+        if None in condicao:
+          selecao |= np.isnan(valores)
+        mascara &= selecao
+    return mascara
+
+  def resumo(self, **filtros):
+    #Contagem, soma, média e desvio padrão de cada medida nas células
+    #selecionadas (agregação total, sem colunas de agrupamento)
+    mascara = self.mascara(**filtros)
+    contagem = self.contagem[mascara].sum()
+    somas = self.somas[mascara].sum(axis=0)
+    media, desvio = estatisticas(contagem, somas, self.quadrados[mascara].sum(axis=0))
+    return {
+      'count': int(contagem),
+      'soma': dict(zip(MEDIDAS, somas.tolist())),
+      'media': dict(zip(MEDIDAS, media.tolist())),
+      'desvio': dict(zip(MEDIDAS, desvio.tolist())),
+    }
+
+  def consultar(self, por=(), **filtros):
+    #Uma linha por combinação das dimensões em "por", com contagem, média e
+    #desvio padrão de cada medida
+    por = list(por)
+    if not por:
+      resumo = self.resumo(**filtros)
+      linha = {'count': resumo['count']}
+      for medida in MEDIDAS:
+        linha[f'media {medida}'] = resumo['media'][medida]
+        linha[f'desvio {medida}'] = resumo['desvio'][medida]
+      return pd.DataFrame([linha])
+    celulas = self.grupos[self.mascara(**filtros)].groupby(por, observed=True, dropna=False)
+    celulas = celulas[['count'] + MEDIDAS + QUADRADOS].sum().reset_index()
+    media, desvio = estatisticas(celulas['count'], celulas[MEDIDAS].to_numpy(dtype=float),
+                                 celulas[QUADRADOS].to_numpy(dtype=float))
+    resultado = celulas[por + ['count']].copy()
+    for posicao, medida in enumerate(MEDIDAS):
+      resultado[f'media {medida}'] = media[:, posicao]
+      resultado[f'desvio {medida}'] = desvio[:, posicao]
+    return resultado
+
+
+#Condição da linha de comando: dimensão, operador e valor
+#Nome da coluna (qualquer texto sem operadores, ex.: "total (R$)"), operador
+#e valor
+CONDICAO = re.compile(r'^\s*([^<>=]+?)\s*(>=|<=|=|>|<)\s*(.*)$')
+
+
+def interpretar(condicoes, dimensoes=DIMENSOES, numericas=('rooms', 'floor'), apelidos=None):
+  #"rooms=3", "city=Campinas,Porto Alegre", "floor>10", "floor=-" (térreo).
+  #As dimensões numéricas são inteiras, então ">" e "<" viram faixas inclusivas.
+  #"apelidos" dá nomes curtos para colunas (ex.: {'total': 'total (R$)'})
+  apelidos = apelidos or {}
+  filtros = {}
+  for texto in condicoes:
+    encontrado = CONDICAO.match(texto)
+    dimensao = apelidos.get(encontrado.group(1), encontrado.group(1)) if encontrado is not None else None
+    if dimensao not in dimensoes:
+      raise ValueError(f'Condição inválida: {texto!r}')
+    _, operador, valor = encontrado.groups()
+    numerica = dimensao in numericas
+    try:
+      if operador == '=':
+        valores = [None if numerica and item == '-' else int(item) if numerica else item for item in valor.split(',')]
+      else:
+        limite = int(valor)
+    except ValueError:
+      raise ValueError(f'Valor inteiro esperado em {texto!r}') from None
+    if operador == '=':
+      filtros[dimensao] = valores if len(valores) > 1 else valores[0]
+    else:
+      faixas = {'>': (limite + 1, None), '>=': (limite, None), '<': (None, limite - 1), '<=': (None, limite)}
+      filtros[dimensao] = faixas[operador]
+  return filtros
+
+
+def main(argumentos=None):
+  parser = argparse.ArgumentParser(description='Consulta o cubo de grupos sem ler as linhas do conjunto de dados.')
+  parser.add_argument('condicoes', nargs='*', help='ex.: city=Campinas furniture=furnished rooms=3 "floor>10"')
+  parser.add_argument('--por', default='', help='dimensões de agrupamento, separadas por vírgula (ex.: city,rooms)')
+  parser.add_argument('--arquivo', default=ARQUIVO_DADOS, help='CSV do conjunto de dados')
+  parser.add_argument('--lotes', help='pasta dos lotes de novos imóveis (padrão: a do arquivo de dados)')
+  opcoes = parser.parse_args(argumentos)
+  por = [dimensao for dimensao in opcoes.por.split(',') if dimensao]
+  if not set(por) <= set(DIMENSOES):
+    parser.error(f'--por aceita apenas {", ".join(DIMENSOES)}')
+
+  try:
+    filtros = interpretar(opcoes.condicoes)
+  except ValueError as erro:
+    parser.error(str(erro))
+
+  #Importada aqui porque a ingestão usa este módulo
+  from painel.ingestao import grupos_com_lotes
+  grupos = grupos_com_lotes(opcoes.arquivo, opcoes.lotes)
+  with pd.option_context('display.max_columns', None, 'display.width', 200):
+    print(Cubo(grupos).consultar(por, **filtros).to_string(index=False))
+
+
+if __name__ == '__main__':
+  main()
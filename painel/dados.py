@@ -0,0 +1,207 @@
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+from painel.agregacoes import classificar_pela_media
+
+try:
+  import pyarrow  # noqa: F401
+except ImportError:
+  pyarrow = None
+
+#Em versões anteriores ao pandas 3.0 o Copy-on-Write precisa ser ativado para
+#que a seleção de colunas devolva visões em vez de cópias
+if int(pd.__version__.split('.')[0]) < 3:
+  pd.set_option('mode.copy_on_write', True)
+
+#Arquivo padrão do conjunto de dados, relativo à raiz do projeto
+ARQUIVO_DADOS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'houses_to_rent_v2.csv')
+#Diretório do cache colunar, criado ao lado do arquivo de dados
+DIRETORIO_CACHE = '.cache'
+
+#Tipos compactos de cada coluna do CSV. O andar é lido como texto porque o
+#térreo aparece como '-' e depois é convertido para inteiro com nulo
+TIPOS_COLUNAS = {
+  'city': 'category',
+  'area': 'int32',
+  'rooms': 'int16',
+  'bathroom': 'int16',
+  'parking spaces': 'int16',
+  'floor': 'string',
+  'animal': 'category',
+  'furniture': 'category',
+  'hoa (R$)': 'int32',
+  'rent amount (R$)': 'int32',
+  'property tax (R$)': 'int32',
+  'fire insurance (R$)': 'int32',
+  'total (R$)': 'int32',
+}
+
+
+#Quantidade de IQRs além dos quartis a partir da qual um valor é outlier
+FATOR_IQR = 4
+
+#Rótulos do realce de custo-benefício pelo preço do metro quadrado
+ROTULOS_METRO_QUADRADO = ('m² abaixo do valor médio', 'm² acima do valor médio')
+
+
+def impressao_digital(caminho=ARQUIVO_DADOS):
+  #Identifica a versão do arquivo pelo tamanho e data de modificação,
+  #sem precisar ler o conteúdo a cada rerun
+  info = os.stat(caminho)
+  chave = f'{os.path.abspath(caminho)}:{info.st_size}:{info.st_mtime_ns}'
+  return hashlib.sha1(chave.encode('utf-8')).hexdigest()[:16]
+
+
+def converter_andar(andar):
+  #'-' (térreo) vira nulo e os demais andares viram inteiros
+  return pd.to_numeric(andar.replace('-', None), errors='coerce').astype('Int16')
+
+
+def ler_csv(caminho=ARQUIVO_DADOS):
+  dados = pd.read_csv(caminho, dtype=TIPOS_COLUNAS)
+  dados['floor'] = converter_andar(dados['floor'])
+  return dados
+
+
+def ler_csv_em_blocos(caminho=ARQUIVO_DADOS, tamanho_bloco=200_000):
+  #Lê o CSV em blocos de linhas, com os mesmos tipos de ler_csv
+  for bloco in pd.read_csv(caminho, dtype=TIPOS_COLUNAS, chunksize=tamanho_bloco):
+    bloco['floor'] = converter_andar(bloco['floor'])
+    yield bloco
+
+
+def caminho_cache(caminho, impressao, tipo=None):
+  #Sem tipo, o cache das linhas; com tipo (ex.: 'cubo'), outro artefato
+  #derivado da mesma versão do arquivo
+  pasta = os.path.join(os.path.dirname(os.path.abspath(caminho)), DIRETORIO_CACHE)
+  nome = os.path.splitext(os.path.basename(caminho))[0]
+  sufixo = f'.{tipo}.parquet' if tipo else '.parquet'
+  return os.path.join(pasta, f'{nome}.{impressao}{sufixo}')
+
+
+def gravar_cache(dados, arquivo):
+  pasta = os.path.dirname(arquivo)
+  os.makedirs(pasta, exist_ok=True)
+  #Remove versões anteriores do mesmo arquivo de dados e do mesmo tipo
+  nome, _, tipo = os.path.basename(arquivo).split('.', 2)
+  for antigo in os.listdir(pasta):
+    partes = antigo.split('.', 2)
+    if len(partes) == 3 and partes[0] == nome and partes[2] == tipo:
+      os.remove(os.path.join(pasta, antigo))
+  #Grava em arquivo temporário e renomeia, para que outras réplicas nunca
+  #leiam um parquet pela metade
+  temporario = f'{arquivo}.{os.getpid()}.tmp'
+  dados.to_parquet(temporario, index=False)
+  os.replace(temporario, arquivo)
+
+
+def ler_artefato(arquivo):
+  #Artefato gravado em caminho_cache (linhas, cubo, limites), ou None quando
+  #ainda não existe ou sem pyarrow
+  if pyarrow is None or not os.path.exists(arquivo):
+    return None
+  return pd.read_parquet(arquivo)
+
+
+def gravar_artefato(dados, arquivo):
+  #Como gravar_cache, mas opcional: sem pyarrow não grava nada
+  if pyarrow is None:
+    return
+  try:
+    gravar_cache(dados, arquivo)
+  except OSError:
+    #Diretório somente leitura: segue sem gravar
+    pass
+
+
+def ler_dados_brutos(caminho=ARQUIVO_DADOS):
+  #Lê o CSV com tipos compactos, reaproveitando o cache colunar (Parquet)
+  #enquanto o arquivo não mudar. Sem pyarrow, lê sempre o CSV
+  arquivo = caminho_cache(caminho, impressao_digital(caminho))
+  dados = ler_artefato(arquivo)
+  if dados is None:
+    dados = ler_csv(caminho)
+    gravar_artefato(dados, arquivo)
+  return dados
+
+
+def limites_iqr(Q1, Q3, fator=FATOR_IQR):
+  #Limites para outliers a partir dos quartis
+  IQR = Q3 - Q1
+  return Q1 - fator * IQR, Q3 + fator * IQR
+
+
+def remove_outliers(dados, campo):
+  #Calculo dos quartis e IQR
+  Q1 = dados[campo].quantile(0.25)
+  Q3 = dados[campo].quantile(0.75)
+  #Define limites para outliers em relação a área
+  limite_inferior, limite_superior = limites_iqr(Q1, Q3)
+  #Retira outliers referente a área
+  dados = dados[(dados[campo] >= limite_inferior) & (dados[campo] <= limite_superior)]
+  return dados
+
+
+def adicionar_derivadas(dados, preco_medio=None):
+  #Colunas derivadas usadas pelos gráficos, calculadas uma única vez na carga.
+  #Sem preco_medio, a referência é a média do próprio conjunto
+  dados = dados.copy(deep=False)
+  dados['preco_metro_quadrado'] = dados['total (R$)'] / dados['area']
+  if preco_medio is None:
+    preco_medio = dados['preco_metro_quadrado'].mean()
+  #Condicao para realce de melhor custo-benefico considerando valor médio do metro quadrado
+  dados['faixa_metro_quadrado'] = classificar_pela_media(dados['preco_metro_quadrado'], preco_medio,
+                                                         rotulos=ROTULOS_METRO_QUADRADO, inclusivo=True)
+  dados['andar'] = dados['floor'].astype('string').fillna('-').astype('category')
+  return dados
+
+
+class TabelaDados:
+  #Acesso somente leitura ao conjunto de dados carregado. O DataFrame fica
+  #compartilhado entre sessões e cada gráfico recebe apenas as colunas que usa,
+  #como visões (Copy-on-Write) e não como cópias do conjunto inteiro.
+  #
+  #"versoes" identifica o conteúdo de cada cidade (None quando desconhecido) e
+  #permite reaproveitar resultados por cidade enquanto a cidade não muda
+
+  def __init__(self, dados, versoes=None):
+    self._dados = dados
+    self.versoes = versoes
+
+  def __len__(self):
+    return len(self._dados)
+
+  @property
+  def nomes_colunas(self):
+    return list(self._dados.columns)
+
+  def colunas(self, *nomes):
+    return self._dados[list(nomes)]
+
+  def coluna(self, nome):
+    return self._dados[nome]
+
+  def filtrar(self, mascara, rotulo=None):
+    #Nova tabela somente com as linhas selecionadas pela máscara. O rótulo
+    #descreve a seleção dentro de cada cidade (filtros que não são de cidade):
+    #sem ele, as versões por cidade deixam de valer; vazio, a seleção mantém
+    #cidades inteiras e as versões continuam as mesmas
+    versoes = None
+    if self.versoes is not None and rotulo is not None:
+      versoes = self.versoes if not rotulo else {cidade: (versao, rotulo) for cidade, versao in self.versoes.items()}
+    return TabelaDados(self._dados[mascara], versoes)
+
+  def particionar(self, coluna, colunas=None):
+    #Uma tabela por valor presente da coluna categórica (só com as colunas
+    #pedidas), com uma única ordenação em vez de uma passada pelo conjunto
+    #para cada valor
+    serie = self._dados[coluna]
+    dados = self._dados if colunas is None else self._dados[list(colunas)]
+    codigos = serie.cat.codes.to_numpy()
+    ordem = np.argsort(codigos, kind='stable')
+    fronteiras = np.searchsorted(codigos[ordem], np.arange(len(serie.cat.categories) + 1))
+    return {valor: TabelaDados(dados.iloc[ordem[inicio:fim]], self.versoes)
+            for valor, inicio, fim in zip(serie.cat.categories, fronteiras[:-1], fronteiras[1:]) if fim > inicio}
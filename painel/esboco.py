@@ -0,0 +1,68 @@
+import numpy as np
+
+#Esboço de quantis aproximados para fluxos de dados (no estilo do KLL).
+#Cada nível guarda até "capacidade" valores; quando um nível enche, ele é
+#ordenado e metade dos valores (alternados) sobe para o nível seguinte com o
+#dobro do peso. Inserir um lote custa proporcional ao tamanho do lote e a
+#memória fica limitada a algumas vezes a capacidade por nível.
+#
+#A escolha dos valores promovidos depende só da semente, do total e do nível,
+#de modo que um esboço reconstruído a partir dos níveis (de_niveis) evolui
+#exatamente como o original.
+
+
+class EsbocoQuantis:
+
+  def __init__(self, capacidade=2048, semente=0):
+    self.capacidade = capacidade
+    self.niveis = [np.empty(0)]
+    self.total = 0
+    self.semente = semente
+
+  def __len__(self):
+    return self.total
+
+  def adicionar(self, valores):
+    valores = np.asarray(valores, dtype=float)
+    valores = valores[~np.isnan(valores)]
+    if len(valores) == 0:
+      return self
+    self.total += len(valores)
+    self.niveis[0] = np.concatenate([self.niveis[0], valores])
+    self._compactar()
+    return self
+
+  @classmethod
+  def de_niveis(cls, niveis, capacidade=2048, semente=0):
+    #Esboço a partir dos itens de cada nível (ex.: gravados em disco). Cada
+    #item do nível n vale 2**n valores, e o total é a soma desses pesos
+    esboco = cls(capacidade, semente)
+    esboco.niveis = [np.asarray(itens, dtype=float) for itens in niveis] or [np.empty(0)]
+    esboco.total = int(sum(len(itens) * 2 ** nivel for nivel, itens in enumerate(esboco.niveis)))
+    return esboco
+
+  def _compactar(self):
+    nivel = 0
+    while nivel < len(self.niveis):
+      itens = self.niveis[nivel]
+      if len(itens) > self.capacidade:
+        itens = np.sort(itens)
+        #Com quantidade ímpar, o maior valor permanece no nível atual
+        sobra = len(itens) % 2
+        inicio = np.random.default_rng([self.semente, self.total, nivel]).integers(2)
+        promovidos = itens[inicio:len(itens) - sobra:2]
+        self.niveis[nivel] = itens[len(itens) - sobra:]
+        if nivel + 1 == len(self.niveis):
+          self.niveis.append(np.empty(0))
+        self.niveis[nivel + 1] = np.concatenate([self.niveis[nivel + 1], promovidos])
+      nivel += 1
+
+  def quantil(self, q):
+    if self.total == 0:
+      return np.nan
+    valores = np.concatenate(self.niveis)
+    pesos = np.concatenate([np.full(len(itens), 2.0 ** nivel) for nivel, itens in enumerate(self.niveis)])
+    ordem = np.argsort(valores, kind='stable')
+    acumulado = np.cumsum(pesos[ordem])
+    posicao = np.searchsorted(acumulado, q * acumulado[-1], side='left')
+    return valores[ordem][min(posicao, len(valores) - 1)]
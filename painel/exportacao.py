@@ -0,0 +1,172 @@
+import argparse
+import gzip
+import html
+import json
+import os
+import shutil
+import time
+
+import plotly.offline
+
+from painel.agregacoes import agregados_de_grupos
+from painel.dados import ARQUIVO_DADOS
+from painel.graficos import FIGURAS, construir_figuras, usar_tema_streamlit
+from painel.ingestao import IngestaoIncremental
+
+#Exportação do dashboard (sem filtros) para um pacote estático:
+#
+#  python -m painel.exportacao --destino estatico
+#
+#A carga dos dados e as agregações rodam uma única vez, e as figuras saem das
+#mesmas funções usadas pelo dashboard (construir_figuras), gravadas como JSON
+#do Plotly. O index.html carrega o Plotly.js uma única vez e busca o JSON de
+#cada figura; as seções recolhidas só buscam as suas figuras quando abertas,
+#como no dashboard. Cada arquivo é gravado também comprimido (.gz), para
+#servidores que entregam a versão pré-comprimida (ex.: gzip_static do nginx).
+#Qualquer servidor de arquivos estáticos atende leitores sem processar nada:
+#
+#  python -m http.server --directory estatico
+
+DIRETORIO_EXPORTACAO = os.environ.get('DASHBOARD_EXPORTACAO', os.path.join(os.path.dirname(ARQUIVO_DADOS), 'estatico'))
+
+#Seções da página, na ordem do dashboard: título, se começa aberta e as linhas
+#de figuras (cada linha dividida em colunas)
+SECOES = [
+  ('Visão global', True, [['fig_total_casas', 'fig_custo_medio', 'fig_metro_quadrado_total']]),
+  ('Visão por cidade', True, [['fig_dados_por_cidade', 'fig_media_total', 'fig_metro_quadrado']]),
+  ('Área e preço do m²', False, [['fig_area_aluguel']]),
+  ('Valores embutidos', False, [['fig_valores_imbutidos']]),
+  ('Animais de estimação', False, [['fig_porcentagem_animais_cidade', 'fig_animais_area', 'fig_animais_custo']]),
+  ('Mobília', False, [['fig_mobilia_distribuicao', 'fig_mobilia_cidades']]),
+  ('Andar e quartos', False, [['fig_dados_quartos'], ['fig_dados_andar']]),
+]
+
+PAGINA = '''<!DOCTYPE html>
+<html lang="pt-BR">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>Dashboard - Aluguel de Casas</title>
+<style>
+  body {{ font-family: "Source Sans Pro", sans-serif; margin: 0 auto; max-width: 1600px; padding: 1rem 2rem; color: #31333f; }}
+  h2 {{ margin: 0.2rem 0; font-weight: 600; }}
+  details {{ border: 1px solid #e6e6ea; border-radius: 0.5rem; margin: 1rem 0; padding: 0.5rem 1rem; }}
+  summary {{ cursor: pointer; font-size: 1.1rem; padding: 0.3rem 0; }}
+  .linha {{ display: grid; gap: 1rem; }}
+  .figura {{ min-height: 450px; }}
+  footer {{ color: #808495; font-size: 0.85rem; margin-top: 2rem; }}
+</style>
+<script src="plotly.min.js"></script>
+</head>
+<body>
+<h2>Universidade Federal do Maranhão - UFMA</h2>
+<h2>Especialização em Análise de Dados e IA</h2>
+<h2>Disciplina Visualização de Dados</h2>
+<hr>
+<h1>Dashboard de Aluguel de Casas</h1>
+<p>Gabriel Silva - <a href="https://github.com/gfcarvalhos/dashboardRentHouses">Github - Projeto</a></p>
+{secoes}
+<footer>Cópia estática de {linhas} imóveis, gerada em {data} (versão dos dados {impressao}).</footer>
+<script>
+  //Busca e desenha as figuras de uma seção uma única vez, quando ela é aberta
+  function desenhar(secao) {{
+    if (!secao.open || secao.dataset.desenhada) return;
+    secao.dataset.desenhada = '1';
+    secao.querySelectorAll('.figura').forEach(function (div) {{
+      fetch('figuras/' + div.dataset.figura + '.json')
+        .then(function (resposta) {{ return resposta.json(); }})
+        .then(function (figura) {{ Plotly.newPlot(div, figura.data, figura.layout, {{responsive: true}}); }});
+    }});
+  }}
+  document.querySelectorAll('details').forEach(function (secao) {{
+    secao.addEventListener('toggle', function () {{ desenhar(secao); }});
+    desenhar(secao);
+  }});
+</script>
+</body>
+</html>
+'''
+
+
+def _html_secoes():
+  partes = []
+  for titulo, aberta, linhas in SECOES:
+    partes.append(f'<details{" open" if aberta else ""}><summary>{html.escape(titulo)}</summary>')
+    for linha in linhas:
+      partes.append(f'<div class="linha" style="grid-template-columns: repeat({len(linha)}, 1fr)">')
+      partes.extend(f'<div class="figura" data-figura="{nome}"></div>' for nome in linha)
+      partes.append('</div>')
+    partes.append('</details>')
+  return '\n'.join(partes)
+
+
+def _gravar(arquivo, conteudo):
+  #Grava o arquivo e a versão pré-comprimida (mtime fixo: mesmo conteúdo,
+  #mesmos bytes, o que mantém ETags estáveis entre exportações)
+  conteudo = conteudo.encode('utf-8') if isinstance(conteudo, str) else conteudo
+  with open(arquivo, 'wb') as saida:
+    saida.write(conteudo)
+  with open(f'{arquivo}.gz', 'wb') as saida:
+    saida.write(gzip.compress(conteudo, compresslevel=9, mtime=0))
+
+
+def pode_substituir(destino):
+  #O destino só é substituído se não existe, se está vazio ou se é uma
+  #exportação anterior (tem manifesto.json), nunca um diretório qualquer
+  if not os.path.exists(destino):
+    return True
+  return os.path.isdir(destino) and (not os.listdir(destino) or
+                                     os.path.isfile(os.path.join(destino, 'manifesto.json')))
+
+
+def exportar(caminho=ARQUIVO_DADOS, destino=DIRETORIO_EXPORTACAO, lotes=None):
+  if not pode_substituir(destino):
+    raise RuntimeError(f'{destino} existe e não é uma exportação do dashboard (sem manifesto.json).')
+  nomes = [nome for _, _, linhas in SECOES for linha in linhas for nome in linha]
+  if sorted(nomes) != sorted(FIGURAS):
+    #Uma figura nova no dashboard precisa de um lugar na página exportada
+    raise RuntimeError(f'SECOES não cobre exatamente as figuras do dashboard: {sorted(set(FIGURAS) ^ set(nomes))}')
+
+  ingestao = IngestaoIncremental.de_arquivo(caminho, lotes=lotes)
+  ingestao.atualizar()
+  usar_tema_streamlit()
+  figuras = construir_figuras(ingestao.tabela, agregados_de_grupos(ingestao.grupos))
+
+  #Grava em um diretório temporário e renomeia ao final, para que o servidor
+  #nunca entregue uma exportação pela metade
+  temporario = f'{os.path.abspath(destino)}.{os.getpid()}.tmp'
+  shutil.rmtree(temporario, ignore_errors=True)
+  os.makedirs(os.path.join(temporario, 'figuras'))
+  for nome, figura in figuras.items():
+    _gravar(os.path.join(temporario, 'figuras', f'{nome}.json'), figura.to_json())
+  _gravar(os.path.join(temporario, 'plotly.min.js'), plotly.offline.get_plotlyjs())
+  _gravar(os.path.join(temporario, 'index.html'),
+          PAGINA.format(secoes=_html_secoes(), linhas=f'{len(ingestao.tabela):,}'.replace(',', '.'),
+                        data=time.strftime('%d/%m/%Y %H:%M'), impressao=ingestao.impressao))
+  with open(os.path.join(temporario, 'manifesto.json'), 'w', encoding='utf-8') as arquivo:
+    json.dump({'impressao': ingestao.impressao, 'linhas': len(ingestao.tabela), 'figuras': nomes},
+              arquivo, ensure_ascii=False, indent=2)
+  shutil.rmtree(destino, ignore_errors=True)
+  os.replace(temporario, destino)
+  return destino
+
+
+def main(argumentos=None):
+  parser = argparse.ArgumentParser(description='Exporta o dashboard sem filtros para um pacote HTML/JSON estático.')
+  parser.add_argument('--arquivo', default=ARQUIVO_DADOS, help='CSV do conjunto de dados')
+  parser.add_argument('--destino', default=DIRETORIO_EXPORTACAO, help='diretório do pacote estático')
+  parser.add_argument('--lotes', help='pasta dos lotes de novos imóveis (padrão: a do arquivo de dados)')
+  opcoes = parser.parse_args(argumentos)
+  if not pode_substituir(opcoes.destino):
+    parser.error(f'--destino {opcoes.destino} existe e não é uma exportação do dashboard (sem manifesto.json)')
+
+  inicio = time.perf_counter()
+  destino = exportar(opcoes.arquivo, opcoes.destino, opcoes.lotes)
+  tamanho = sum(os.path.getsize(os.path.join(pasta, arquivo))
+                for pasta, _, arquivos in os.walk(destino) for arquivo in arquivos if arquivo.endswith('.gz'))
+  print(f'Pacote estático gerado em {time.perf_counter() - inicio:.1f} s ({tamanho / 2 ** 20:.1f} MB comprimido): '
+        f'{destino}')
+
+
+if __name__ == '__main__':
+  main()
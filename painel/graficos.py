@@ -0,0 +1,623 @@
+import os
+
+import plotly.express as px
+import plotly.graph_objects as go
+import plotly.io
+from plotly.subplots import make_subplots
+
+from painel.histogramas import CALCULOS_HISTOGRAMAS, calcular_histogramas, histograma_2d
+
+#Quantidade máxima de pontos enviados ao navegador no gráfico de dispersão.
+#Acima dela os pontos são amostrados por estrato (animal x cidade) e, acima
+#de FATOR_DENSIDADE vezes o limite, o gráfico vira um mapa de densidade
+LIMITE_PONTOS_DISPERSAO = int(os.environ.get('DASHBOARD_LIMITE_PONTOS', 20000))
+FATOR_DENSIDADE = 10
+
+MODOS_DISPERSAO = {
+  'webgl': 'Todos os imóveis (WebGL)',
+  'amostra': 'Amostra estratificada por aceite de animais e cidade (WebGL)',
+  'densidade': 'Densidade de imóveis calculada no servidor',
+}
+
+#Construção das figuras do dashboard. Cada função recebe apenas as tabelas
+#que usa e devolve a figura pronta, sem depender do Streamlit.
+
+
+def usar_tema_streamlit():
+  #Tema padrão do Plotly igual ao das sessões do Streamlit, para figuras
+  #construídas fora delas (pré-cálculo e exportação estática). Importado aqui
+  #para que o módulo continue sem depender do Streamlit
+  from streamlit.elements.lib.streamlit_plotly_theme import configure_streamlit_plotly_theme
+  configure_streamlit_plotly_theme()
+  plotly.io.templates.default = 'streamlit'
+
+def _barras_histograma(fig, histograma):
+  #Barras lado a lado com a largura do intervalo, como em um px.histogram
+  largura = float(histograma['fim'].iloc[0] - histograma['inicio'].iloc[0]) if len(histograma) else None
+  fig.update_traces(width=largura,
+                    hovertemplate='%{customdata[0]:,.0f} - %{customdata[1]:,.0f} m²<br>Imóveis: %{y}<extra></extra>')
+  fig.update_layout(bargap=0)
+
+
+#Primeira linha de graficos - Visao Global
+def figura_total_casas(agregados):
+  fig_total_casas = go.Figure(go.Indicator(
+    mode = "number",
+    value = agregados['total_casas'],
+    title = {"text": "Quantidade Total de Imóveis", "font": {"size": 20}},
+    number = {'valueformat': ",.0f", 'font': {"size": 50}}
+  ))
+  fig_total_casas.update_layout(
+    height=150,
+    width=270,
+    margin=dict(l=50, r=20, t=50, b=20),
+  )
+  return fig_total_casas
+
+
+def figura_custo_medio(agregados):
+  fig = go.Figure(go.Indicator(
+    mode = "number",
+    value = agregados['valor_medio_geral'],
+    title = {"text": "Custo Médio do Aluguel", "font": {"size": 20}},
+    number = {'prefix': "R$ ", 'valueformat': ',.2f', 'font': {"size": 45}}
+  ))
+  fig.update_layout(
+    height=150,
+    width=270,
+    margin=dict(l=20, r=20, t=50, b=20),
+  )
+  return fig
+
+
+def figura_metro_quadrado_total(agregados):
+  fig_metro_quadrado_total = go.Figure(go.Indicator(
+    mode = "number",
+    value = agregados['metro_quadrado_total'],
+    title = {"text": "Custo do Metro Quadrado", "font": {"size": 20}},
+    number = {'prefix': "R$ ", 'valueformat': ',.2f', 'font': {"size": 45}, 'suffix': '/m²'}
+  ))
+  fig_metro_quadrado_total.update_layout(
+    height=150,
+    width=270,
+    margin=dict(l=20, r=20, t=50, b=20),
+  )
+  return fig_metro_quadrado_total
+
+
+#Segunda linha de gráficos - Visao Global por Cidade
+def figura_dados_por_cidade(agregados):
+  #Grafico de arvore representando a distribuição de imoveis por cidade
+  dados_por_cidade = agregados['dados_por_cidade']
+
+  fig_dados_por_cidade = px.treemap(dados_por_cidade,values='count',path=['city'],
+                                title='Distribuição de Imóveis por Cidade',
+                                color_discrete_sequence=px.colors.sequential.Blues_r,
+                                custom_data=['percent']
+                                )
+  #Adiciona quantidade de imoveis e porcentagem por cidade e fonte da letra
+  fig_dados_por_cidade.update_traces(
+    texttemplate='%{label}<br>%{value} imóveis<br>%{customdata:.2f}%',
+    textfont=dict(size=12, color='white', family='Arial, sans-serif', weight='bold'),
+    hovertemplate='<b>%{label}</b><br>Quantidade: %{value}<br>Porcentagem: %{customdata:.2f}%'
+  )
+  #Reposiciona o titulo
+  fig_dados_por_cidade.update_layout(
+    title={
+          'text': 'Distribuição de Imóveis por Cidade',
+            'y': 0.90,
+            'x': 0.5,
+            'xanchor': 'center',
+            'yanchor': 'top',}
+)
+  return fig_dados_por_cidade
+
+
+def figura_media_total(agregados):
+  #Grafico do valor médio do aluguel por cidade comparando ao valor medio geral
+  dados_media_total = agregados['dados_media_total']
+  media_aluguel = agregados['media_aluguel']
+
+  fig_media_total = px.bar(dados_media_total, x='city', y='total (R$)',
+                     title="Média do Valor de Aluguel por Cidade",
+                     labels={'total (R$)': 'Valor médio de aluguel (R$)', 'city': 'Cidade', 'color': 'Custo'},
+                     color = 'color',
+                     text='R$ ' + dados_media_total['total (R$)'].astype(str),
+                    color_discrete_map={
+                      'Abaixo da média': '#aec7e8',
+                      'Acima da média': '#1f77b4'
+                    })
+  #Formata fonte da letra
+  fig_media_total.update_traces(textfont=dict(size=9, color='white', family='Arial, sans-serif', weight='bold'))
+  #Posiciona o titulo
+  fig_media_total.update_layout(
+    xaxis_title=None,
+    showlegend=False,
+    title={
+          'text': 'Média do Valor de Aluguel por Cidade',
+            'y': 0.90,
+            'x': 0.55,
+            'xanchor': 'center',
+            'yanchor': 'top',}
+)
+  #Adiciona uma linha pontilhada horizontal para a média
+  fig_media_total.add_shape(
+    type="line",
+    x0=-0.5, #inicio do eixo
+    x1=len(dados_media_total)-0.5, #fim do eixo
+    y0=media_aluguel,
+    y1=media_aluguel,
+    line=dict(color="gold", width=2, dash="dash"),
+  )
+  #Legenda para a linha pontilhada
+  fig_media_total.add_annotation(
+    x=len(dados_media_total) - 0.5,
+    y=media_aluguel*1.05,
+    text=f"Custo médio",
+    showarrow=False,
+    font=dict(size=12, color="gold"),
+    xanchor="right"
+  )
+  return fig_media_total
+
+
+def figura_metro_quadrado(agregados):
+  #Grafico 3 - valor medio
+  dados_media = agregados['dados_media']
+  media_metro_quadrado = agregados['media_metro_quadrado']
+
+  fig_metro_quadrado = px.bar(dados_media, x= 'metro_quadrado', y='city',
+                              title='Valor do metro quadrado por cidade',
+                              orientation='h',
+                              text='R$ ' + dados_media['metro_quadrado'].astype(str),
+                              labels={'metro_quadrado': 'Valor médio do Metro Quadrado (R$)', 'city': 'Cidade'},
+                              color = 'color',
+                              color_discrete_map={
+                                'Abaixo da média': '#aec7e8',
+                                'Acima da média': '#1f77b4'
+                             })
+  fig_metro_quadrado.update_traces(textfont=dict(size=10, color='white', family='Arial, sans-serif', weight='bold'))
+  fig_metro_quadrado.update_layout(
+    xaxis_title=None,
+    yaxis_title=None,
+    showlegend=False,
+    title={
+          'text': 'Valor do Metro Quadrado por Cidade',
+            'y': 0.90,
+            'x': 0.5,
+            'xanchor': 'center',
+            'yanchor': 'top',}
+)
+
+  #Adiciona uma linha pontilhada horizontal para a média
+  fig_metro_quadrado.add_shape(
+    type="line",
+    x0=media_metro_quadrado,
+    x1=media_metro_quadrado,
+    y0=-0.5, #inicio do eixo
+    y1=len(dados_media)-0.5, #fim do eixo
+    line=dict(color="gold", width=2, dash="dash"),
+  )
+
+  #Legenda para a linha pontilhada
+  fig_metro_quadrado.add_annotation(
+    y=len(dados_media) - 0.5,
+    x=media_metro_quadrado,
+    text=f"Custo médio",
+    showarrow=False,
+    font=dict(size=12, color="gold"),
+    yanchor="bottom"
+  )
+  return fig_metro_quadrado
+
+
+#Terceira linha de gráficos - Histograma Qtd x area x custo medio do m²
+def figura_area_aluguel(histograma):
+  #Contagens por intervalo de área, cidade e faixa de preço/m² (calculadas no servidor)
+  fig_area_aluguel = px.bar(histograma, x='centro', y='count',
+                                 color='faixa_metro_quadrado',
+                                 facet_col='city',
+                                 custom_data=['inicio', 'fim'],
+                                 labels={'faixa_metro_quadrado': 'Legenda'},
+                                 color_discrete_map={
+                                    'm² abaixo do valor médio': '#aec7e8',
+                                    'm² acima do valor médio': '#1f77b4'
+                                })
+  _barras_histograma(fig_area_aluguel, histograma)
+  fig_area_aluguel.update_layout(
+    title={
+          'text': 'Distribuição de Imóveis por Área com Destaque para Preço/m² Abaixo da Média',
+            'y': 0.97,
+            'x': 0.5,
+            'xanchor': 'center',
+            'yanchor': 'top',},
+    yaxis_title=None,
+    yaxis=dict(title='Distribuição de Imóveis', title_font=dict(size=14))
+  )
+  #Atualiza o titulo dos eixos X
+  fig_area_aluguel.for_each_xaxis(lambda xaxis: xaxis.update(title='Área (m²)', title_font=dict(size=14)))
+  #Acrescenta bordas por intervalo
+  fig_area_aluguel.update_traces(marker_line=dict(color='black', width=1))
+  #Atualiza o subtitulo dos histogramas
+  fig_area_aluguel.for_each_annotation(lambda a: a.update(text=a.text.split('=')[1]))
+  return fig_area_aluguel
+
+
+#Quarta linha de gráficos - Valores imbutidos no aluguel por cidade
+def figura_valores_imbutidos(agregados):
+  dados_medios_imbutidos = agregados['dados_medios_imbutidos']
+
+  fig_valores_imbutidos = px.area(dados_medios_imbutidos,
+                                    x="city",
+                                    y=['rent amount (R$)', 'hoa (R$)', 'property tax (R$)', 'fire insurance (R$)'],
+                                    labels={'value': 'Média dos Valores Imbutidos (R$)', 'city': 'Cidades'},
+                                    title='Distribuição da Média dos Valores Embutidos no Aluguel por Cidade',
+                                    )
+
+  labels = {
+    'rent amount (R$)': 'Aluguel (R$)',
+    'hoa (R$)': 'Taxa de HOA (R$)',
+    'property tax (R$)': 'Valor do IPTU (R$)',
+    'fire insurance (R$)': 'Seguro Contra Incêndio (R$)',
+  }
+  fig_valores_imbutidos.for_each_trace(lambda t: t.update(name=labels[t.name]))
+  fig_valores_imbutidos.update_traces(stackgroup = None,
+                                      fill = 'tozeroy',
+                                      mode="markers+lines",
+                                      hovertemplate=None)
+
+  fig_valores_imbutidos.update_layout(
+    title={
+          'text': 'Distribuição da Média dos Valores Embutidos no Aluguel por Cidade',
+            'y': 0.9,
+            'x': 0.5,
+            'xanchor': 'center',
+            'yanchor': 'top',},
+    legend_title='Legenda',
+    xaxis_title=None
+  )
+  fig_valores_imbutidos.update_xaxes(range=[-0.2, len(dados_medios_imbutidos['city']) - 0.2])
+  return fig_valores_imbutidos
+
+
+#Quinta linha de gráficos - Análise para animais de estimação
+def figura_porcentagem_animais_cidade(agregados):
+  #Grafico de porcentagem de aceites e não aceites
+  contagem_animais = agregados['contagem_animais']
+
+  fig_porcentagem_animais_cidade = go.Figure()
+
+  dados_aceita_animais = contagem_animais[contagem_animais['animal'] == 'acept']
+  dados_nao_aceita_animais = contagem_animais[contagem_animais['animal'] == 'not acept']
+  #Grafico de acept
+  fig_porcentagem_animais_cidade.add_trace(go.Bar(
+    y=dados_aceita_animais['city'],
+    x=dados_aceita_animais['percent'],
+    name='Aceita',
+    orientation='h',
+    marker_color='#aec7e8',
+    text=dados_aceita_animais['percent'].round(2).astype(str) + '%',
+    textposition='inside',
+    customdata=dados_aceita_animais['percent'],
+    hovertemplate='%{y}<br>Aceita: %{x:.2f}%<extra></extra>'
+))
+  #Grafico de not acept
+  fig_porcentagem_animais_cidade.add_trace(go.Bar(
+    y=dados_nao_aceita_animais['city'],
+    x=-dados_nao_aceita_animais['percent'],
+    name='Não Aceita',
+    orientation='h',
+    marker_color='#1f77b4',
+    text=dados_nao_aceita_animais['percent'].round(2).astype(str) + '%',
+    textposition='inside',
+    hovertemplate='%{y}<br>Não Aceita: %{customdata:.2f}%<extra></extra>',
+    customdata=dados_nao_aceita_animais['percent']
+))
+  fig_porcentagem_animais_cidade.update_layout(
+    title={
+          'text': 'Porcentagem de Imóveis em Aceite de Animais',
+            'y': 0.9,
+            'x': 0.5,
+            'xanchor': 'center',
+            'yanchor': 'top',},
+    xaxis_title=None,
+    yaxis_title= None,
+    barmode='overlay',
+    xaxis=dict(showgrid=True, zeroline=True, showticklabels=False),
+    showlegend=True,
+    )
+  return fig_porcentagem_animais_cidade
+
+
+def figura_animais_area(histograma, caixa):
+  #Grafico 2 - Quanto a area
+  #Histograma por aceite de animais com um boxplot marginal de estatísticas
+  #pré-calculadas, já que o violino precisaria das linhas originais
+  nomes = {'acept': 'Aceita', 'not acept': 'Não Aceita'}
+  cores = dict(zip(nomes, px.colors.qualitative.Plotly))
+  animais = [animal for animal in nomes if animal in set(histograma['animal'])]
+
+  fig_animais_area = make_subplots(rows=2, cols=max(len(animais), 1), shared_xaxes=True, shared_yaxes=True,
+                                   row_heights=[0.25, 0.75], vertical_spacing=0.03, horizontal_spacing=0.03)
+  for coluna, animal in enumerate(animais, start=1):
+    barras = histograma[histograma['animal'] == animal]
+    resumo = caixa[caixa['animal'] == animal]
+    fig_animais_area.add_trace(go.Box(
+      name=nomes[animal],
+      legendgroup=animal,
+      showlegend=False,
+      orientation='h',
+      q1=resumo['q1'], median=resumo['mediana'], q3=resumo['q3'],
+      lowerfence=resumo['limite_inferior'], upperfence=resumo['limite_superior'],
+      y=[nomes[animal]],
+      marker_color=cores[animal],
+    ), row=1, col=coluna)
+    fig_animais_area.add_trace(go.Bar(
+      x=barras['centro'],
+      y=barras['count'],
+      name=nomes[animal],
+      legendgroup=animal,
+      marker_color=cores[animal],
+      customdata=barras[['inicio', 'fim']],
+    ), row=2, col=coluna)
+    fig_animais_area.update_yaxes(showticklabels=False, row=1, col=coluna)
+    fig_animais_area.update_xaxes(title='Área (m²)', row=2, col=coluna)
+
+  _barras_histograma(fig_animais_area, histograma)
+  fig_animais_area.update_traces(selector=dict(type='box'), hovertemplate=None)
+  #Coloca bordas nos intervalos
+  fig_animais_area.update_traces(selector=dict(type='bar'), marker_line=dict(color='black', width=1))
+
+  #Atualiza layout
+  fig_animais_area.update_layout(
+    title={
+          'text': 'Distribuição de Imóveis por Área em Aceite de Animais',
+            'y': 0.9,
+            'x': 0.5,
+            'xanchor': 'center',
+            'yanchor': 'top',},
+    legend_title=None,
+  )
+  fig_animais_area.update_yaxes(title='Distribuição de Imóveis por área', row=2, col=1)
+  return fig_animais_area
+
+
+def modo_dispersao(quantidade, limite=LIMITE_PONTOS_DISPERSAO):
+  if quantidade <= limite:
+    return 'webgl'
+  if quantidade <= limite * FATOR_DENSIDADE:
+    return 'amostra'
+  return 'densidade'
+
+
+def amostra_estratificada(dados, limite, estratos):
+  #Amostra proporcional ao tamanho de cada estrato, sem percorrer linha a linha
+  fracao = min(1.0, limite / max(len(dados), 1))
+  return dados.groupby(estratos, observed=True, group_keys=False).sample(frac=fracao, random_state=0)
+
+
+def figura_animais_custo(dados, limite=LIMITE_PONTOS_DISPERSAO):
+  #Grafico 3 - Quanto a custo
+  dados_animais_custo = dados
+  modo = modo_dispersao(len(dados_animais_custo), limite)
+
+  if modo == 'densidade':
+    densidade = histograma_2d(dados_animais_custo, 'area', 'total (R$)', 60, por=['animal'])
+    fig_animais_custo = px.density_heatmap(densidade,
+                                           x='area',
+                                           y='total (R$)',
+                                           z='count',
+                                           facet_col='animal',
+                                           color_continuous_scale= px.colors.sequential.Blues,
+                                           labels={'area': 'Área (m²)', 'count': 'Imóveis'})
+    fig_animais_custo.for_each_annotation(lambda a: a.update(text='Aceita' if a.text.endswith('=acept') else 'Não Aceita'))
+  else:
+    if modo == 'amostra':
+      dados_animais_custo = amostra_estratificada(dados, limite, ['animal', 'city'])
+    fig_animais_custo = px.scatter(dados_animais_custo,
+                                   x='area',
+                                   y='total (R$)',
+                                   color='animal',
+                                   render_mode='webgl',
+                                   labels={'area': 'Área (m²)'})
+
+  # Adicionando um retângulo claro para realçar uma área específica
+  fig_animais_custo.add_shape(
+    type="rect",
+    x0=50,
+    x1=200,
+    y0=0,
+    y1=dados['total (R$)'].max()*1.02,
+    fillcolor="rgba(255, 255, 0, 0.2)",
+    line=dict(color="rgba(255, 255, 0, 0)"),
+  )
+  #Atualiza legenda
+  fig_animais_custo.for_each_trace(lambda t: t.update(name='Aceita' if t.name == 'acept' else 'Não Aceita'))
+
+  fig_animais_custo.update_layout(
+    title={
+          'text': 'Distribuição de Imóveis por Área e Custo em Aceite de Animais',
+            'y': 0.9,
+            'x': 0.5,
+            'xanchor': 'center',
+            'yanchor': 'top',},
+    legend_title=None,
+  )
+  #Indica na própria figura quando os pontos não são todos os imóveis
+  if modo != 'webgl':
+    fig_animais_custo.add_annotation(text=MODOS_DISPERSAO[modo], showarrow=False,
+                                     xref='paper', yref='paper', x=0, y=1.02,
+                                     xanchor='left', yanchor='bottom', font=dict(size=10))
+  return fig_animais_custo
+
+
+#Sexta linha de gráfico - Análise para mobília
+def figura_mobilia_distribuicao(histograma):
+  #Contagens por intervalo de área e mobília (calculadas no servidor)
+  fig_mobilia_distribuicao = px.bar(histograma,
+                                          x='centro',
+                                          y='count',
+                                          color='furniture',
+                                          custom_data=['inicio', 'fim'],
+                                          labels={'centro': 'Área (m²)'},
+                                          title='Distribuição de Imóveis Mobiliados e não Mobiliados',
+                                          color_discrete_map={
+                                            'furnished': '#aec7e8',
+                                            'not furnished': '#1f77b4'
+                                          }
+                                          )
+  _barras_histograma(fig_mobilia_distribuicao, histograma)
+  fig_mobilia_distribuicao.update_layout(
+    legend_title=None,
+    title={
+          'text': 'Distribuição de Imóveis Mobiliados e não Mobiliados',
+            'y': 0.9,
+            'x': 0.5,
+            'xanchor': 'center',
+            'yanchor': 'top',},
+    yaxis_title='Distribuição de Imóveis por área',
+  )
+  #Atualiza legenda
+  fig_mobilia_distribuicao.for_each_trace(lambda t: t.update(name='Mobiliado' if t.name == 'furnished' else 'Não Mobiliado'))
+  #Acrescenta bordas por intervalo
+  fig_mobilia_distribuicao.update_traces(marker_line=dict(color='black', width=1))
+  return fig_mobilia_distribuicao
+
+
+def figura_mobilia_cidades(agregados):
+  #Grafico 2 - Visao por cidade
+  dados_mobilia_cidades = agregados['dados_mobilia_cidades']
+
+  fig_mobilia_cidades = px.scatter(dados_mobilia_cidades,
+                   x='city',
+                   y='preco_medio',
+                   size ='count',
+                   color='furniture',
+                   title='Distribuição de Imóveis por Valor e Quantidade (size) nas Cidades',
+                   color_discrete_map={
+                     'furnished': '#aec7e8',
+                     'not furnished': '#1f77b4'
+                   })
+  #Atualiza legenda
+  fig_mobilia_cidades.for_each_trace(lambda t: t.update(name='Mobiliado' if t.name == 'furnished' else 'Não Mobiliado'))
+  #Acrescenta bordas por intervalo
+  fig_mobilia_cidades.update_layout(
+    title={
+          'text': 'Distribuição de Imóveis por valor médio e quantidade (size) nas Cidades',
+            'y': 0.9,
+            'x': 0.5,
+            'xanchor': 'center',
+            'yanchor': 'top',},
+    yaxis_title='Média de Custo do Alugel (R$)',
+    xaxis_title='Área (m²)',
+    legend_title=None
+  )
+  return fig_mobilia_cidades
+
+
+#Sétima linha de gráfico - Análise por andar e quantidade de quartos
+def figura_dados_quartos(agregados):
+  dados_quartos = agregados['dados_quartos']
+
+  fig_dados_quartos = px.density_heatmap(dados_quartos,
+                                        z='valor_medio',
+                                        x='rooms',
+                                        y='city',
+                                        color_continuous_scale= px.colors.sequential.Blues_r,
+                                        title='Relação entre Quartos, Aluguel e Cidade')
+  fig_dados_quartos.update_traces(xbins=dict(start=1, end=agregados['quantidade_quartos'], size=1))
+  fig_dados_quartos.update_layout(
+    coloraxis_colorbar_title='Valor Médio do Aluguel (R$)',
+    title={
+          'text': 'Relação entre Quartos, Valor Médio de Aluguel e Cidade',
+            'y': 0.9,
+            'x': 0.5,
+            'xanchor': 'center',
+            'yanchor': 'top',},
+    yaxis_title=None,
+    xaxis_title='Quantidade de Quartos'
+  )
+  return fig_dados_quartos
+
+
+def figura_dados_andar(agregados):
+  #Valor médio por andar e cidade já agregado, uma célula por linha da tabela
+  dados_andar = agregados['dados_andar']
+
+  fig_dados_andar = px.density_heatmap(dados_andar,
+                                        z='valor_medio',
+                                        x='andar',
+                                        y='city',
+                                        labels={'andar': 'Andar'},
+                                        color_continuous_scale= px.colors.sequential.Blues_r,
+                                        title='Relação entre Andar, Aluguel e Cidade')
+  fig_dados_andar.update_traces(xbins=dict(start=1, end=dados_andar['andar'].nunique(), size=1))
+  fig_dados_andar.update_layout(
+    coloraxis_colorbar_title='Valor Médio do Aluguel (R$)',
+    title={
+          'text': 'Relação entre Andar, Valor Médio de Aluguel e Cidade',
+            'y': 0.9,
+            'x': 0.5,
+            'xanchor': 'center',
+            'yanchor': 'top',},
+    yaxis_title=None,
+    xaxis_title='Andar'
+  )
+  return fig_dados_andar
+
+
+#Função construtora de cada figura, pelo nome usado no layout, e as entradas
+#que ela recebe: 'agregados', 'dispersao' (colunas do gráfico de dispersão)
+#ou o nome de uma tabela de CALCULOS_HISTOGRAMAS
+FIGURAS = {
+  'fig_total_casas': (figura_total_casas, ['agregados']),
+  'fig_custo_medio': (figura_custo_medio, ['agregados']),
+  'fig_metro_quadrado_total': (figura_metro_quadrado_total, ['agregados']),
+  'fig_dados_por_cidade': (figura_dados_por_cidade, ['agregados']),
+  'fig_media_total': (figura_media_total, ['agregados']),
+  'fig_metro_quadrado': (figura_metro_quadrado, ['agregados']),
+  'fig_area_aluguel': (figura_area_aluguel, ['area_aluguel']),
+  'fig_valores_imbutidos': (figura_valores_imbutidos, ['agregados']),
+  'fig_porcentagem_animais_cidade': (figura_porcentagem_animais_cidade, ['agregados']),
+  'fig_animais_area': (figura_animais_area, ['animais_area', 'animais_area_caixa']),
+  'fig_animais_custo': (figura_animais_custo, ['dispersao']),
+  'fig_mobilia_distribuicao': (figura_mobilia_distribuicao, ['mobilia_distribuicao']),
+  'fig_mobilia_cidades': (figura_mobilia_cidades, ['agregados']),
+  'fig_dados_quartos': (figura_dados_quartos, ['agregados']),
+  'fig_dados_andar': (figura_dados_andar, ['agregados']),
+}
+
+
+def _entrada(entrada, tabela, agregados, histogramas):
+  #Os gráficos por linha recebem somente as colunas que utilizam
+  if entrada == 'agregados':
+    return agregados
+  if entrada == 'dispersao':
+    return tabela.colunas('area', 'total (R$)', 'animal', 'city')
+  if histogramas is not None:
+    return histogramas[entrada]
+  return CALCULOS_HISTOGRAMAS[entrada](tabela)
+
+
+def preparar_figura(nome, tabela, agregados, histogramas=None):
+  #Função construtora e argumentos de uma figura. Sem "histogramas", calcula
+  #apenas as tabelas que essa figura usa
+  funcao, entradas = FIGURAS[nome]
+  return (funcao, *(_entrada(entrada, tabela, agregados, histogramas) for entrada in entradas))
+
+
+def preparar_figuras(tabela, agregados, histogramas=None):
+  #Funções construtoras e argumentos de todas as figuras
+  if histogramas is None:
+    histogramas = calcular_histogramas(tabela)
+  return {nome: preparar_figura(nome, tabela, agregados, histogramas) for nome in FIGURAS}
+
+
+def construir_figura(nome, tabela, agregados):
+  funcao, *argumentos = preparar_figura(nome, tabela, agregados)
+  return funcao(*argumentos)
+
+
+def construir_figuras(tabela, agregados):
+  #Todas as figuras do dashboard, pelo nome usado no layout
+  return {nome: funcao(*argumentos) for nome, (funcao, *argumentos) in preparar_figuras(tabela, agregados).items()}
@@ -0,0 +1,129 @@
+import numpy as np
+import pandas as pd
+
+from painel.cidades import por_cidade
+
+#Histogramas e resumos de distribuição calculados no servidor. Os gráficos
+#recebem apenas as contagens por intervalo, e não as linhas do conjunto.
+
+
+def tamanho_intervalo(minimo, maximo, nbins):
+  #Tamanho "redondo" (1, 2 ou 5 x 10^k), como no autobin do Plotly
+  bruto = (maximo - minimo) / nbins
+  if bruto <= 0:
+    return 1.0
+  escala = 10.0 ** np.floor(np.log10(bruto))
+  for passo in (1, 2, 5, 10):
+    if passo * escala >= bruto:
+      return passo * escala
+
+
+def bordas_intervalos(valores, nbins):
+  valores = np.asarray(valores)
+  if len(valores) == 0:
+    return np.array([0.0, 1.0])
+  minimo, maximo = valores.min(), valores.max()
+  tamanho = tamanho_intervalo(minimo, maximo, nbins)
+  inicio = np.floor(minimo / tamanho) * tamanho
+  quantidade = int((maximo - inicio) // tamanho) + 1
+  return inicio + tamanho * np.arange(quantidade + 1)
+
+
+def histograma(dados, coluna, nbins, por=(), bordas=None):
+  #Contagem de linhas por intervalo [inicio, fim) e por cada combinação das
+  #colunas em "por". As bordas são compartilhadas entre os grupos, como nos
+  #histogramas com facetas do Plotly
+  por = list(por)
+  valores = dados[coluna].to_numpy()
+  if bordas is None:
+    bordas = bordas_intervalos(valores, nbins)
+  intervalo = np.searchsorted(bordas, valores, side='right') - 1
+  intervalo = np.clip(intervalo, 0, len(bordas) - 2)
+
+  #.array mantém as colunas categóricas como códigos (to_numpy criaria um
+  #array de objetos, bem mais lento de agrupar)
+  chaves = {nome: dados[nome].array for nome in por}
+  chaves['intervalo'] = intervalo
+  contagem = pd.DataFrame(chaves).groupby(por + ['intervalo'], observed=True).size()
+  contagem = contagem.reset_index(name='count')
+
+  contagem['inicio'] = bordas[contagem['intervalo']]
+  contagem['fim'] = bordas[contagem['intervalo'] + 1]
+  contagem['centro'] = (contagem['inicio'] + contagem['fim']) / 2
+  return contagem.drop(columns='intervalo')
+
+
+def histograma_2d(dados, x, y, nbins, por=()):
+  #Contagem por célula de uma grade x/y (mapa de densidade), com as mesmas
+  #regras de intervalo do histograma de uma dimensão
+  por = list(por)
+  codigos = {nome: dados[nome].to_numpy() for nome in por}
+  centros = {}
+  for eixo in (x, y):
+    valores = dados[eixo].to_numpy()
+    bordas = bordas_intervalos(valores, nbins)
+    codigos[eixo] = np.clip(np.searchsorted(bordas, valores, side='right') - 1, 0, len(bordas) - 2)
+    centros[eixo] = (bordas[:-1] + bordas[1:]) / 2
+  contagem = pd.DataFrame(codigos).groupby(por + [x, y], observed=True).size().reset_index(name='count')
+  for eixo in (x, y):
+    contagem[eixo] = centros[eixo][contagem[eixo]]
+  return contagem
+
+
+def resumo_caixa(dados, coluna, por):
+  #Quartis e limites dos bigodes (1,5 x IQR) por grupo, no formato aceito
+  #pelo go.Box com estatísticas pré-calculadas
+  agrupado = dados.groupby(por, observed=True)[coluna]
+  resumo = agrupado.quantile([0.25, 0.5, 0.75]).unstack()
+  resumo.columns = ['q1', 'mediana', 'q3']
+  iqr = resumo['q3'] - resumo['q1']
+  limites = pd.DataFrame({'minimo': resumo['q1'] - 1.5 * iqr, 'maximo': resumo['q3'] + 1.5 * iqr})
+
+  valores = dados[[por, coluna]].join(limites, on=por)
+  dentro = valores[(valores[coluna] >= valores['minimo']) & (valores[coluna] <= valores['maximo'])]
+  resumo['limite_inferior'] = dentro.groupby(por, observed=True)[coluna].min()
+  resumo['limite_superior'] = dentro.groupby(por, observed=True)[coluna].max()
+  return resumo.reset_index()
+
+
+#Tabelas usadas pelos histogramas do dashboard, uma função por gráfico
+def _contar_area_aluguel(parte, bordas):
+  return histograma(parte.colunas('area', 'faixa_metro_quadrado'), 'area', 30, por=['faixa_metro_quadrado'],
+                    bordas=np.array(bordas))
+
+
+def histograma_area_aluguel(tabela):
+  #Um painel por cidade: as bordas são comuns a todas as cidades e a contagem
+  #de cada cidade é feita à parte (em paralelo e com cache por cidade)
+  bordas = tuple(bordas_intervalos(tabela.coluna('area').to_numpy(), 30))
+  partes = por_cidade(tabela, 'area_aluguel', ['area', 'faixa_metro_quadrado'], _contar_area_aluguel, bordas)
+  if not partes:
+    return histograma(tabela.colunas('area', 'city', 'faixa_metro_quadrado'), 'area', 30,
+                      por=['city', 'faixa_metro_quadrado'])
+  contagem = pd.concat(partes.values(), ignore_index=True)
+  contagem.insert(0, 'city', np.repeat(list(partes), [len(parte) for parte in partes.values()]))
+  return contagem
+
+
+def histograma_animais_area(tabela):
+  return histograma(tabela.colunas('area', 'animal'), 'area', 30, por=['animal'])
+
+
+def caixa_animais_area(tabela):
+  return resumo_caixa(tabela.colunas('area', 'animal'), 'area', 'animal')
+
+
+def histograma_mobilia_distribuicao(tabela):
+  return histograma(tabela.colunas('area', 'furniture'), 'area', 40, por=['furniture'])
+
+
+CALCULOS_HISTOGRAMAS = {
+  'area_aluguel': histograma_area_aluguel,
+  'animais_area': histograma_animais_area,
+  'animais_area_caixa': caixa_animais_area,
+  'mobilia_distribuicao': histograma_mobilia_distribuicao,
+}
+
+
+def calcular_histogramas(tabela):
+  return {nome: calculo(tabela) for nome, calculo in CALCULOS_HISTOGRAMAS.items()}
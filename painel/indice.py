@@ -0,0 +1,76 @@
+import numpy as np
+
+#Colunas filtráveis do dashboard
+COLUNAS_CATEGORICAS = ['city', 'animal', 'furniture']
+COLUNAS_FAIXA = ['rooms', 'total (R$)']
+
+
+class IndiceFiltros:
+  #Índice pré-calculado para os filtros da barra lateral: uma máscara booleana
+  #por valor de cada coluna categórica e as posições ordenadas de cada coluna
+  #numérica. Uma mudança de filtro combina máscaras e faz buscas binárias, sem
+  #percorrer o conjunto de dados novamente
+
+  def __init__(self, tabela):
+    self.tamanho = len(tabela)
+    self.mascaras = {}
+    for coluna in COLUNAS_CATEGORICAS:
+      serie = tabela.coluna(coluna)
+      codigos = serie.cat.codes.to_numpy()
+      self.mascaras[coluna] = {valor: codigos == codigo for codigo, valor in enumerate(serie.cat.categories)}
+    self.ordenados = {}
+    for coluna in COLUNAS_FAIXA:
+      valores = tabela.coluna(coluna).to_numpy()
+      posicoes = np.argsort(valores, kind='stable')
+      self.ordenados[coluna] = (valores[posicoes], posicoes)
+
+  def valores(self, coluna):
+    return list(self.mascaras[coluna])
+
+  def limites(self, coluna):
+    ordenados = self.ordenados[coluna][0]
+    if len(ordenados) == 0:
+      return (0, 0)
+    return (ordenados[0].item(), ordenados[-1].item())
+
+  def categorias(self, coluna, selecionados):
+    mascara = np.zeros(self.tamanho, dtype=bool)
+    for valor in selecionados:
+      mascara |= self.mascaras[coluna][valor]
+    return mascara
+
+  def faixa(self, coluna, minimo, maximo):
+    ordenados, posicoes = self.ordenados[coluna]
+    inicio = np.searchsorted(ordenados, minimo, side='left')
+    fim = np.searchsorted(ordenados, maximo, side='right')
+    mascara = np.zeros(self.tamanho, dtype=bool)
+    mascara[posicoes[inicio:fim]] = True
+    return mascara
+
+  def normalizar(self, filtros):
+    #Remove filtros que não restringem nada (todas as categorias ou a faixa
+    #completa), para que combinações equivalentes compartilhem o mesmo cache
+    ativos = {}
+    for coluna in COLUNAS_CATEGORICAS:
+      selecionados = filtros.get(coluna)
+      if selecionados is not None and set(selecionados) != set(self.valores(coluna)):
+        ativos[coluna] = tuple(sorted(selecionados))
+    for coluna in COLUNAS_FAIXA:
+      faixa = filtros.get(coluna)
+      if faixa is not None and tuple(faixa) != self.limites(coluna):
+        ativos[coluna] = tuple(faixa)
+    return ativos
+
+  def mascara(self, filtros):
+    #Máscara das linhas que atendem a todos os filtros; None quando nenhum
+    #filtro está ativo
+    filtros = self.normalizar(filtros)
+    if not filtros:
+      return None
+    mascara = np.ones(self.tamanho, dtype=bool)
+    for coluna, valor in filtros.items():
+      if coluna in self.mascaras:
+        mascara &= self.categorias(coluna, valor)
+      else:
+        mascara &= self.faixa(coluna, *valor)
+    return mascara
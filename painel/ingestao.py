@@ -0,0 +1,272 @@
+import glob
+import logging
+import os
+import threading
+
+import numpy as np
+
+from painel.agregacoes import DIMENSOES, MEDIDAS, agrupar, combinar_grupos
+from painel.dados import (ARQUIVO_DADOS, TIPOS_COLUNAS, TabelaDados, adicionar_derivadas, impressao_digital,
+                          ler_csv, ler_dados_brutos)
+from painel.blocos import LIMITE_AMOSTRA, ler_em_blocos
+from painel.cubo import gravar_grupos, ler_grupos
+from painel.motores import MOTOR, MotorDuckDB, MotorPandas, duckdb
+from painel.outliers import (CAMPOS_OUTLIERS, POR_OUTLIERS, LimitesOutliers, gravar_esbocos, gravar_limites,
+                             ler_esbocos, ler_limites)
+from painel.quadros import concatenar
+
+#Diretório onde chegam os lotes de novos imóveis (CSVs com o mesmo esquema
+#do arquivo principal), ao lado do arquivo de dados. Só os arquivos *.csv são
+#lidos: quem grava um lote deve gravá-lo com outro nome (ex.: 001.csv.tmp) e
+#renomeá-lo ao final, para que um lote pela metade nunca seja lido
+DIRETORIO_LOTES = os.environ.get('DASHBOARD_LOTES', os.path.join(os.path.dirname(ARQUIVO_DADOS), 'lotes'))
+
+registro = logging.getLogger('painel.ingestao')
+
+
+def diretorio_lotes(caminho=ARQUIVO_DADOS):
+  #Pasta de lotes de um arquivo de dados: DIRETORIO_LOTES para o arquivo
+  #principal e "lotes_<nome>" ao lado de qualquer outro, para que um conjunto
+  #nunca receba os lotes de outro
+  if os.path.abspath(caminho) == os.path.abspath(ARQUIVO_DADOS):
+    return DIRETORIO_LOTES
+  pasta, arquivo = os.path.split(os.path.abspath(caminho))
+  return os.path.join(pasta, f'lotes_{os.path.splitext(arquivo)[0]}')
+
+
+def ler_lote(arquivo):
+  #Lê um arquivo de lote. Um arquivo malformado (CSV inválido, valores fora
+  #dos tipos ou colunas faltando) levanta ValueError
+  try:
+    lote = ler_csv(arquivo)
+  except KeyError as erro:
+    raise ValueError(f'coluna ausente: {erro}') from erro
+  faltando = [coluna for coluna in TIPOS_COLUNAS if coluna not in lote.columns]
+  if faltando:
+    raise ValueError(f'colunas ausentes: {", ".join(faltando)}')
+  return lote
+
+
+#Arquivos acima deste tamanho são lidos em blocos (fora da memória)
+LIMITE_MEMORIA_MB = int(os.environ.get('DASHBOARD_LIMITE_MEMORIA_MB', 512))
+
+
+class IngestaoIncremental:
+  #Conjunto de dados em modo somente acréscimo. Cada lote novo alimenta os
+  #esboços de quantis de outliers (EsbocosOutliers, iniciados na carga com
+  #todas as linhas), os limites são recalculados a partir dos esboços e o
+  #lote passa pelo filtro com esses limites. Os grupos (contagens e somas por
+  #dimensão) são atualizados apenas com o lote, de modo que o custo de um
+  #acréscimo acompanha o tamanho do lote. As linhas já aceitas não são
+  #filtradas de novo quando os limites mudam.
+  #
+  #Com limites por cidade, uma cidade que aparece pela primeira vez em um lote
+  #ganha o próprio esboço. O realce de preço/m² dos novos imóveis usa a média
+  #corrente no momento do acréscimo.
+  #
+  #Quando a carga foi feita em blocos (amostrado=True), as linhas guardadas
+  #são uma amostra; os grupos continuam cobrindo todos os imóveis.
+  #
+  #Os lotes são lidos de diretorio_lotes, que de_arquivo deriva do arquivo
+  #de dados carregado
+
+  def __init__(self, dados, grupos, limites, esbocos, soma_preco, quantidade_preco, impressao, amostrado=False,
+               lotes=DIRETORIO_LOTES):
+    self.impressao_base = impressao
+    self.amostrado = amostrado
+    self.diretorio_lotes = lotes
+    self.versao = 0
+    #Versão de cada cidade: só muda quando um lote traz imóveis da cidade
+    self.versoes_cidades = {}
+    self.lotes = set()
+    #Lotes malformados já registrados: {arquivo: data de modificação}. Um
+    #arquivo regravado (outra data) é lido de novo
+    self.rejeitados = {}
+    self._trava = threading.RLock()
+    self.limites = limites
+    self.esbocos = esbocos
+    self.grupos = grupos
+    self._soma_preco = soma_preco
+    self._quantidade_preco = quantidade_preco
+    self._partes = [dados]
+    self._tabela = None
+
+  @classmethod
+  def de_motor(cls, motor, impressao, limite_amostra=None, semente=0, grupos=None, limites=None, esbocos=None):
+    #Carga inicial com as consultas feitas pelo motor (pandas ou DuckDB): os
+    #limites de outliers (todas as colunas em uma consulta), os esboços dos
+    #lotes seguintes, os grupos e o preço médio do m² são calculados no motor,
+    #e só as linhas aceitas vêm para a memória. Acima de limite_amostra
+    #linhas, vem uma amostra (amostrado=True). Com grupos, limites ou esboços
+    #já conhecidos (gravados em uma carga anterior), eles não são recalculados
+    if limites is None:
+      limites = LimitesOutliers.de_quartis(motor.quartis(CAMPOS_OUTLIERS, POR_OUTLIERS), CAMPOS_OUTLIERS, POR_OUTLIERS)
+    if esbocos is None:
+      esbocos = motor.esbocos(CAMPOS_OUTLIERS, POR_OUTLIERS)
+    soma_preco, quantidade = motor.preco_metro_quadrado(limites)
+    amostrado = limite_amostra is not None and quantidade > limite_amostra
+    dados = motor.linhas(limites, limite_amostra if amostrado else None, semente)
+    #Sem amostra, o realce do m² usa a média das próprias linhas, como no
+    #carregamento normal
+    dados = adicionar_derivadas(dados, soma_preco / max(quantidade, 1) if amostrado else None)
+    if grupos is None:
+      grupos = motor.agrupar(limites)
+    return cls(dados, grupos, limites, esbocos, soma_preco, quantidade, impressao, amostrado)
+
+  @classmethod
+  def de_brutos(cls, brutos, impressao, grupos=None, limites=None, esbocos=None):
+    #Carga inicial com os quartis exatos, como no carregamento normal
+    return cls.de_motor(MotorPandas(brutos), impressao, grupos=grupos, limites=limites, esbocos=esbocos)
+
+  @classmethod
+  def de_blocos(cls, caminho=ARQUIVO_DADOS, **opcoes):
+    resultado = ler_em_blocos(caminho, **opcoes)
+    return cls(resultado['amostra'], resultado['grupos'], resultado['limites'], resultado['esbocos'],
+               resultado['soma_preco'], resultado['linhas'], impressao_digital(caminho), amostrado=True)
+
+  @classmethod
+  def de_arquivo(cls, caminho=ARQUIVO_DADOS, motor=MOTOR, lotes=None):
+    #Arquivos grandes: com o DuckDB, as consultas leem o arquivo sob demanda e
+    #só uma amostra das linhas vem para a memória; com o pandas, lê em blocos.
+    #Os limites e os esboços de outliers e os grupos (cubo) do arquivo
+    #principal ficam gravados ao lado dele. Sem "lotes", a pasta de lotes é a
+    #do arquivo
+    impressao = impressao_digital(caminho)
+    limites = ler_limites(caminho, impressao)
+    esbocos = ler_esbocos(caminho, impressao) if limites is not None else None
+    grupos = ler_grupos(caminho, impressao) if esbocos is not None else None
+    grande = os.path.getsize(caminho) > LIMITE_MEMORIA_MB * 1024 * 1024
+    if motor == 'duckdb' and duckdb is not None:
+      ingestao = cls.de_motor(MotorDuckDB(caminho), impressao, LIMITE_AMOSTRA if grande else None, grupos=grupos,
+                              limites=limites, esbocos=esbocos)
+    elif grande:
+      ingestao = cls.de_blocos(caminho, limites=limites, esbocos=esbocos)
+    else:
+      ingestao = cls.de_brutos(ler_dados_brutos(caminho), impressao, grupos, limites, esbocos)
+    if limites is None:
+      gravar_limites(ingestao.limites, caminho, impressao)
+    if esbocos is None:
+      gravar_esbocos(ingestao.esbocos, caminho, impressao)
+    if grupos is None:
+      gravar_grupos(ingestao.grupos, caminho, impressao)
+    ingestao.diretorio_lotes = lotes or diretorio_lotes(caminho)
+    return ingestao
+
+  @classmethod
+  def restaurar(cls, dados, grupos, estado, lotes=None):
+    #Reconstrói a ingestão a partir de dados, grupos e do estado gravado por
+    #estado() (por exemplo, no armazém pré-calculado). Sem "lotes", usa a
+    #pasta de lotes gravada no estado
+    ingestao = cls(dados, grupos, estado['limites'], estado['esbocos'], estado['soma_preco'],
+                   estado['quantidade_preco'], estado['impressao_base'], estado['amostrado'],
+                   lotes or estado.get('diretorio_lotes', DIRETORIO_LOTES))
+    ingestao.versao = estado['versao']
+    ingestao.versoes_cidades = dict(estado.get('versoes_cidades', {}))
+    ingestao.lotes = set(estado['lotes'])
+    return ingestao
+
+  def estado(self):
+    #Tudo o que a ingestão mantém além das linhas e dos grupos
+    with self._trava:
+      return {
+        'impressao_base': self.impressao_base,
+        'amostrado': self.amostrado,
+        'versao': self.versao,
+        'versoes_cidades': dict(self.versoes_cidades),
+        'lotes': sorted(self.lotes),
+        'diretorio_lotes': self.diretorio_lotes,
+        'limites': self.limites,
+        'esbocos': self.esbocos,
+        'soma_preco': self._soma_preco,
+        'quantidade_preco': self._quantidade_preco,
+      }
+
+  @property
+  def impressao(self):
+    #Muda a cada lote acrescentado, invalidando os caches que dependem dela
+    return f'{self.impressao_base}-{self.versao}'
+
+  @property
+  def tabela(self):
+    #As partes acrescentadas são unidas uma única vez por versão
+    with self._trava:
+      if self._tabela is None:
+        dados = concatenar(self._partes)
+        self._partes = [dados]
+        versoes = {cidade: (self.impressao_base, self.versoes_cidades.get(cidade, 0))
+                   for cidade in dados['city'].cat.categories}
+        self._tabela = TabelaDados(dados, versoes)
+      return self._tabela
+
+  def acrescentar(self, lote):
+    #Acrescenta um lote bruto (DataFrame com as colunas do CSV) e devolve a
+    #quantidade de linhas aceitas depois do filtro de outliers
+    with self._trava:
+      self.esbocos.adicionar(lote)
+      self.limites = self.esbocos.limites()
+      lote = self.limites.filtrar(lote)
+
+      preco_metro_quadrado = (lote['total (R$)'] / lote['area']).to_numpy()
+      self._soma_preco += float(np.sum(preco_metro_quadrado))
+      self._quantidade_preco += len(lote)
+      preco_medio = self._soma_preco / max(self._quantidade_preco, 1)
+
+      self._partes.append(adicionar_derivadas(lote, preco_medio))
+      self._tabela = None
+      for cidade in lote['city'].unique():
+        self.versoes_cidades[cidade] = self.versoes_cidades.get(cidade, 0) + 1
+      self.grupos = combinar_grupos(self.grupos, agrupar(lote[DIMENSOES + MEDIDAS]))
+      self.versao += 1
+      return len(lote)
+
+  def atualizar(self, diretorio=None):
+    #Acrescenta os arquivos de lote ainda não processados, em ordem de nome, e
+    #devolve quantos foram acrescentados. Um lote malformado é registrado no
+    #log e ignorado (sem interromper os demais) até que o arquivo seja
+    #regravado; um arquivo que some ou não pode ser lido é tentado de novo na
+    #próxima atualização
+    diretorio = diretorio or self.diretorio_lotes
+    with self._trava:
+      acrescentados = 0
+      for arquivo in sorted(glob.glob(os.path.join(diretorio, '*.csv'))):
+        if arquivo in self.lotes:
+          continue
+        try:
+          modificacao = os.stat(arquivo).st_mtime_ns
+          if self.rejeitados.get(arquivo) == modificacao:
+            continue
+          lote = ler_lote(arquivo)
+        except OSError:
+          continue
+        except ValueError as erro:
+          registro.warning('Lote ignorado %s: %s', arquivo, erro)
+          self.rejeitados[arquivo] = modificacao
+          continue
+        self.acrescentar(lote)
+        self.lotes.add(arquivo)
+        self.rejeitados.pop(arquivo, None)
+        acrescentados += 1
+      return acrescentados
+
+
+def grupos_com_lotes(caminho=ARQUIVO_DADOS, lotes=None):
+  #Grupos (cubo) do arquivo com os lotes da pasta já somados, como na
+  #ingestão. Com o cubo e os esboços de outliers gravados, lê apenas eles e os
+  #lotes; sem eles, faz a carga completa, que os grava
+  lotes = lotes or diretorio_lotes(caminho)
+  impressao = impressao_digital(caminho)
+  esbocos = ler_esbocos(caminho, impressao)
+  grupos = ler_grupos(caminho, impressao) if esbocos is not None else None
+  if grupos is None:
+    ingestao = IngestaoIncremental.de_arquivo(caminho, lotes=lotes)
+    ingestao.atualizar()
+    return ingestao.grupos
+  for arquivo in sorted(glob.glob(os.path.join(lotes, '*.csv'))):
+    try:
+      lote = ler_lote(arquivo)
+    except ValueError as erro:
+      registro.warning('Lote ignorado %s: %s', arquivo, erro)
+      continue
+    limites = esbocos.adicionar(lote).limites()
+    grupos = combinar_grupos(grupos, agrupar(limites.filtrar(lote)[DIMENSOES + MEDIDAS]))
+  return grupos
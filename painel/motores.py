@@ -0,0 +1,175 @@
+import os
+
+from painel.agregacoes import DIMENSOES, MEDIDAS, QUADRADOS, agrupar
+from painel.dados import ARQUIVO_DADOS, TIPOS_COLUNAS, caminho_cache, impressao_digital
+from painel.outliers import EsbocosOutliers, quartis
+
+try:
+  import duckdb
+except ImportError:
+  duckdb = None
+
+#Motores de consulta usados na carga do conjunto de dados. Todos respondem às
+#mesmas perguntas; exceto os quartis, sempre sobre as linhas dentro dos
+#limites de outliers ("limites": LimitesOutliers, globais ou por cidade):
+#
+#  quartis(campos, por)          quartis de várias colunas, por grupo, em uma
+#                                única consulta sobre todas as linhas
+#  esbocos(campos, por)          esboços de quantis (EsbocosOutliers) das
+#                                mesmas colunas, também sobre todas as linhas
+#  agrupar(limites)              grupos (contagem e somas por dimensão)
+#  preco_metro_quadrado(limites) soma do preço do m² e quantidade de linhas
+#  linhas(limites, amostra)      linhas aceitas (ou uma amostra delas)
+#
+#O motor pandas trabalha sobre o DataFrame em memória. O motor DuckDB envia
+#as consultas ao banco embutido, que lê o Parquet (ou o CSV) sob demanda e
+#em várias threads, e só traz para a memória o resultado de cada consulta
+
+#Motor padrão da carga: pandas ou duckdb (sem o duckdb instalado, usa pandas)
+MOTOR = os.environ.get('DASHBOARD_MOTOR', 'pandas')
+
+
+class MotorPandas:
+
+  def __init__(self, dados):
+    self.dados = dados
+    self._filtrados = {}
+
+  def _filtrar(self, limites):
+    #Uma única máscara para todas as colunas, guardada por objeto de limites
+    if id(limites) not in self._filtrados:
+      self._filtrados[id(limites)] = (limites, limites.filtrar(self.dados))
+    return self._filtrados[id(limites)][1]
+
+  def quartis(self, campos, por=None):
+    return quartis(self.dados, campos, por)
+
+  def esbocos(self, campos, por=None):
+    return EsbocosOutliers.calcular(self.dados, campos, por)
+
+  def agrupar(self, limites):
+    return agrupar(self._filtrar(limites)[DIMENSOES + MEDIDAS])
+
+  def preco_metro_quadrado(self, limites):
+    dados = self._filtrar(limites)
+    return float((dados['total (R$)'] / dados['area']).sum()), len(dados)
+
+  def linhas(self, limites, amostra=None, semente=0):
+    dados = self._filtrar(limites)
+    if amostra is not None and len(dados) > amostra:
+      dados = dados.sample(amostra, random_state=semente).reset_index(drop=True)
+    return dados
+
+
+#Tipos do DuckDB equivalentes aos de TIPOS_COLUNAS na leitura do CSV
+TIPOS_DUCKDB = {'category': 'VARCHAR', 'string': 'VARCHAR', 'int16': 'SMALLINT', 'int32': 'INTEGER'}
+
+
+def _nome(coluna):
+  return '"' + coluna.replace('"', '""') + '"'
+
+
+def _texto(valor):
+  return "'" + valor.replace("'", "''") + "'"
+
+
+class MotorDuckDB:
+
+  def __init__(self, caminho=ARQUIVO_DADOS):
+    if duckdb is None:
+      raise RuntimeError('O motor DuckDB precisa do pacote duckdb instalado.')
+    self.conexao = duckdb.connect()
+    colunas = ', '.join(_nome(coluna) for coluna in TIPOS_COLUNAS if coluna != 'floor')
+    parquet = caminho_cache(caminho, impressao_digital(caminho))
+    #Reaproveita o cache colunar quando existe; senão lê o CSV diretamente
+    if os.path.exists(parquet):
+      fonte = f'read_parquet({_texto(parquet)})'
+      andar = 'floor'
+    else:
+      tipos = ', '.join(f'{_texto(coluna)}: {_texto(TIPOS_DUCKDB[tipo])}' for coluna, tipo in TIPOS_COLUNAS.items())
+      fonte = f'read_csv({_texto(caminho)}, header=true, types={{{tipos}}})'
+      andar = "TRY_CAST(NULLIF(floor, '-') AS SMALLINT) AS floor"
+    self.conexao.execute(f'CREATE VIEW imoveis AS SELECT {colunas}, {andar} FROM {fonte}')
+
+  def _condicoes(self, limites):
+    #Condição de outliers de todas as colunas. Por grupo, cada limite vira um
+    #CASE sobre o grupo (grupos sem limites dão NULL e ficam de fora), o que
+    #mantém a ordem das linhas, como na máscara do pandas
+    condicoes = []
+    parametros = []
+    for campo in limites.campos:
+      faixa = []
+      for lado in ('inferior', 'superior'):
+        valores = limites.tabela[f'{campo} {lado}'].astype(float).tolist()
+        if limites.por is None:
+          faixa.append('?')
+          parametros.append(valores[0])
+        else:
+          casos = ' '.join('WHEN ? THEN ?' for _ in valores)
+          faixa.append(f'(CASE {_nome(limites.por)}::VARCHAR {casos} END)')
+          for grupo, valor in zip(limites.tabela[limites.por].astype(str), valores):
+            parametros += [grupo, valor]
+      condicoes.append(f'{_nome(campo)} BETWEEN {faixa[0]} AND {faixa[1]}')
+    return ' AND '.join(condicoes) or 'true', parametros
+
+  def _consultar(self, selecao, limites, final='', amostra=None, semente=0):
+    condicoes, parametros = self._condicoes(limites)
+    fonte = f'(SELECT * FROM imoveis WHERE {condicoes})'
+    if amostra is not None:
+      #A amostragem do DuckDB vale para o FROM, antes do WHERE
+      fonte += f' USING SAMPLE reservoir({int(amostra)} ROWS) REPEATABLE ({int(semente)})'
+    return self.conexao.execute(f'SELECT {selecao} FROM {fonte} {final}', parametros)
+
+  def quartis(self, campos, por=None):
+    #Todos os quartis em uma única consulta (quantile_cont interpola como o
+    #quantile do pandas)
+    selecao = ', '.join(f'quantile_cont({_nome(campo)}, [0.25, 0.75]) AS {_nome(campo)}' for campo in campos)
+    if por is None:
+      resultado = self.conexao.execute(f'SELECT {selecao} FROM imoveis').df()
+    else:
+      resultado = self.conexao.execute(f'SELECT {_nome(por)}, {selecao} FROM imoveis GROUP BY {_nome(por)} '
+                                       f'ORDER BY {_nome(por)}').df()
+    tabela = resultado[[por]].copy() if por else resultado[[]].copy()
+    for campo in campos:
+      tabela[f'{campo} q1'] = resultado[campo].str[0]
+      tabela[f'{campo} q3'] = resultado[campo].str[1]
+    return tabela
+
+  def esbocos(self, campos, por=None, tamanho_bloco=200_000):
+    #As linhas vêm do banco em blocos (de vetores de 2048 linhas), e só o
+    #bloco atual fica na memória
+    colunas = ', '.join(_nome(coluna) for coluna in ([por] if por else []) + list(campos))
+    resultado = self.conexao.execute(f'SELECT {colunas} FROM imoveis')
+    esbocos = EsbocosOutliers(campos, por)
+    while True:
+      bloco = resultado.fetch_df_chunk(tamanho_bloco // 2048)
+      if len(bloco) == 0:
+        return esbocos
+      esbocos.adicionar(bloco)
+
+  def agrupar(self, limites):
+    #Mesmo formato (tipos das dimensões e ordem das linhas) do agrupar do
+    #pandas. As somas ficam em 64 bits, já que podem passar do limite do int32
+    dimensoes = ', '.join(_nome(dimensao) for dimensao in DIMENSOES)
+    somas = ', '.join(f'SUM({_nome(medida)})::BIGINT AS {_nome(medida)}' for medida in MEDIDAS)
+    somas += ''.join(f', SUM({_nome(medida)}::DOUBLE * {_nome(medida)}) AS {_nome(quadrado)}'
+                     for medida, quadrado in zip(MEDIDAS, QUADRADOS))
+    ordem = ', '.join(_nome(dimensao) + ' NULLS LAST' for dimensao in DIMENSOES)
+    grupos = self._consultar(f'{dimensoes}, COUNT(*) AS count, {somas}', limites,
+                             f'GROUP BY {dimensoes} ORDER BY {ordem}').df()
+    return _converter_tipos(grupos, DIMENSOES)
+
+  def preco_metro_quadrado(self, limites):
+    soma, quantidade = self._consultar('SUM("total (R$)" / area), COUNT(*)', limites).fetchone()
+    return float(soma or 0.0), quantidade
+
+  def linhas(self, limites, amostra=None, semente=0):
+    colunas = ', '.join(_nome(coluna) for coluna in TIPOS_COLUNAS)
+    return _converter_tipos(self._consultar(colunas, limites, amostra=amostra, semente=semente).df())
+
+
+def _converter_tipos(dados, colunas=TIPOS_COLUNAS):
+  #Tipos compactos do carregamento pelo pandas (o andar já vem como inteiro)
+  tipos = {coluna: 'Int16' if coluna == 'floor' else TIPOS_COLUNAS[coluna] for coluna in colunas}
+  return dados.astype(tipos)
+
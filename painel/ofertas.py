@@ -0,0 +1,183 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from painel.cubo import interpretar
+from painel.dados import ARQUIVO_DADOS
+from painel.ingestao import IngestaoIncremental
+
+#Busca dos imóveis de melhor custo-benefício: os k menores preços do m² (ou
+#as k menores pontuações ponderadas) entre os imóveis que atendem às
+#restrições de cidade, quartos, banheiros, vagas, animais e mobília.
+#
+#O índice é construído uma vez por versão dos dados, com as posições dos
+#imóveis de cada cidade já ordenadas pelo preço do m². Uma busca pelo preço do
+#m² percorre essas posições em blocos crescentes, a partir do mais barato,
+#até encontrar k imóveis que atendem às restrições, sem ordenar o conjunto a
+#cada consulta. A busca pela pontuação seleciona os k melhores com
+#argpartition (seleção linear), ordenando apenas esses k:
+#
+#  ofertas.melhores(10, city=['Campinas'], rooms=(2, None), animal='acept')
+#  ofertas.melhores(10, pesos={'preco_metro_quadrado': 1, 'area': -0.5})
+#
+#Condições como no cubo: um valor, uma lista de valores ou uma faixa
+#(minimo, maximo) inclusiva, com None para o lado aberto
+
+#Colunas que aceitam restrições
+RESTRICOES = ['city', 'rooms', 'bathroom', 'parking spaces', 'animal', 'furniture', 'total (R$)']
+#Nomes curtos aceitos na linha de comando (os mesmos parâmetros da API)
+APELIDOS = {'total': 'total (R$)'}
+#Colunas que podem entrar na pontuação. Peso positivo penaliza valores altos
+#e peso negativo os favorece (ex.: área maior)
+PONTUAVEIS = ['preco_metro_quadrado', 'total (R$)', 'area', 'rooms', 'bathroom', 'parking spaces']
+#Colunas exibidas no resultado
+COLUNAS_OFERTAS = ['city', 'area', 'rooms', 'bathroom', 'parking spaces', 'andar', 'animal', 'furniture',
+                   'total (R$)', 'preco_metro_quadrado']
+#Tamanho do primeiro bloco percorrido por cidade (dobra a cada bloco)
+BLOCO_MINIMO = 256
+
+
+class IndiceOfertas:
+
+  def __init__(self, tabela):
+    self.tabela = tabela
+    cidades = tabela.coluna('city')
+    self.cidades = list(cidades.cat.categories)
+    codigos = cidades.cat.codes.to_numpy()
+    self.preco = tabela.coluna('preco_metro_quadrado').to_numpy(dtype=float)
+    #Uma única ordenação por (cidade, preço do m²), fatiada por cidade
+    ordem = np.lexsort((self.preco, codigos))
+    fronteiras = np.searchsorted(codigos[ordem], np.arange(len(self.cidades) + 1))
+    self.ordenados = {cidade: ordem[inicio:fim]
+                      for cidade, inicio, fim in zip(self.cidades, fronteiras[:-1], fronteiras[1:])}
+    self.valores = {}
+    for coluna in RESTRICOES[1:]:
+      serie = tabela.coluna(coluna)
+      if isinstance(serie.dtype, pd.CategoricalDtype):
+        codigos_coluna = {valor: codigo for codigo, valor in enumerate(serie.cat.categories)}
+        self.valores[coluna] = (serie.cat.codes.to_numpy(), codigos_coluna)
+      else:
+        self.valores[coluna] = (serie.to_numpy(dtype=float), None)
+    #Cada coluna pontuável já padronizada (média 0 e desvio 1), para que os
+    #pesos sejam comparáveis entre colunas de escalas diferentes
+    self.padronizados = {}
+    for coluna in PONTUAVEIS:
+      valores = tabela.coluna(coluna).to_numpy(dtype=float)
+      desvio = valores.std() if len(valores) else 0.0
+      self.padronizados[coluna] = (valores - valores.mean()) / (desvio if desvio > 0 else 1.0)
+
+  def __len__(self):
+    return len(self.preco)
+
+  def _mascara(self, posicoes, restricoes):
+    #Quais das posições atendem a todas as restrições (exceto a cidade)
+    mascara = np.ones(len(posicoes), dtype=bool)
+    for coluna, condicao in restricoes.items():
+      valores, codigos = self.valores[coluna]
+      valores = valores[posicoes]
+      if isinstance(condicao, tuple):
+        minimo, maximo = condicao
+        if minimo is not None:
+          mascara &= valores >= minimo
+        if maximo is not None:
+          mascara &= valores <= maximo
+      elif isinstance(condicao, (list, set, frozenset)):
+        selecao = [codigos[valor] for valor in condicao if valor in codigos] if codigos is not None else list(condicao)
+        mascara &= np.isin(valores, selecao)
+      else:
+        mascara &= valores == (codigos.get(condicao, -2) if codigos is not None else condicao)
+    return mascara
+
+  def _primeiros(self, posicoes, k, restricoes):
+    #Os k primeiros (mais baratos) que atendem às restrições, percorrendo as
+    #posições já ordenadas em blocos que dobram de tamanho
+    encontrados = []
+    quantidade = 0
+    inicio = 0
+    passo = max(4 * k, BLOCO_MINIMO)
+    while inicio < len(posicoes) and quantidade < k:
+      bloco = posicoes[inicio:inicio + passo]
+      bloco = bloco[self._mascara(bloco, restricoes)]
+      encontrados.append(bloco)
+      quantidade += len(bloco)
+      inicio += passo
+      passo *= 2
+    return np.concatenate(encontrados)[:k] if encontrados else np.empty(0, dtype=np.intp)
+
+  def pontuar(self, posicoes, pesos):
+    #Soma ponderada das colunas padronizadas; menor é melhor
+    pontuacao = np.zeros(len(posicoes))
+    for coluna, peso in pesos.items():
+      if peso:
+        pontuacao += peso * self.padronizados[coluna][posicoes]
+    return pontuacao
+
+  def melhores(self, k=10, pesos=None, **restricoes):
+    #DataFrame com os k melhores imóveis, do melhor para o pior. Sem pesos, a
+    #ordem é pelo preço do m²; com pesos ({coluna: peso}), pela pontuação
+    cidades = restricoes.pop('city', None)
+    if cidades is None:
+      cidades = self.cidades
+    elif not isinstance(cidades, (list, set, frozenset, tuple)):
+      cidades = [cidades]
+    cidades = [cidade for cidade in cidades if cidade in self.ordenados]
+
+    if not pesos:
+      #Os k melhores de cada cidade bastam para os k melhores no total
+      candidatos = np.concatenate([self._primeiros(self.ordenados[cidade], k, restricoes) for cidade in cidades]
+                                  or [np.empty(0, dtype=np.intp)])
+      ordem = np.argsort(self.preco[candidatos], kind='stable')[:k]
+      posicoes = candidatos[ordem]
+      pontuacao = None
+    else:
+      candidatos = np.concatenate([self.ordenados[cidade] for cidade in cidades] or [np.empty(0, dtype=np.intp)])
+      candidatos = candidatos[self._mascara(candidatos, restricoes)]
+      pontuacao = self.pontuar(candidatos, pesos)
+      if len(candidatos) > k:
+        selecionados = np.argpartition(pontuacao, k)[:k]
+        candidatos, pontuacao = candidatos[selecionados], pontuacao[selecionados]
+      ordem = np.argsort(pontuacao, kind='stable')
+      posicoes, pontuacao = candidatos[ordem], pontuacao[ordem]
+
+    resultado = self.tabela.colunas(*COLUNAS_OFERTAS).iloc[posicoes].reset_index(drop=True)
+    if pontuacao is not None:
+      resultado['pontuação'] = pontuacao
+    return resultado
+
+
+def main(argumentos=None):
+  parser = argparse.ArgumentParser(description='Imóveis de melhor custo-benefício (menor preço do m² ou pontuação).')
+  parser.add_argument('condicoes', nargs='*',
+                      help='ex.: city=Campinas "rooms>=2" "bathroom>=2" "parking spaces>=1" animal=acept '
+                           '"total<=3000" (ou "total (R$)<=3000")')
+  parser.add_argument('-k', type=int, default=10, help='quantidade de imóveis')
+  parser.add_argument('--peso', action='append', default=[],
+                      help=f'peso de uma coluna na pontuação, ex.: area=-0.5 ({", ".join(PONTUAVEIS)})')
+  parser.add_argument('--arquivo', default=ARQUIVO_DADOS, help='CSV do conjunto de dados')
+  parser.add_argument('--lotes', help='pasta dos lotes de novos imóveis (padrão: a do arquivo de dados)')
+  opcoes = parser.parse_args(argumentos)
+  pesos = {}
+  for texto in opcoes.peso:
+    coluna, _, peso = texto.rpartition('=')
+    coluna = APELIDOS.get(coluna, coluna)
+    if coluna not in PONTUAVEIS:
+      parser.error(f'--peso aceita apenas {", ".join(PONTUAVEIS)}')
+    try:
+      pesos[coluna] = float(peso)
+    except ValueError:
+      parser.error(f'Peso numérico esperado em {texto!r}')
+  try:
+    restricoes = interpretar(opcoes.condicoes, RESTRICOES, ['rooms', 'bathroom', 'parking spaces', 'total (R$)'],
+                             APELIDOS)
+  except ValueError as erro:
+    parser.error(str(erro))
+
+  ingestao = IngestaoIncremental.de_arquivo(opcoes.arquivo, lotes=opcoes.lotes)
+  ingestao.atualizar()
+  with pd.option_context('display.max_columns', None, 'display.width', 200):
+    print(IndiceOfertas(ingestao.tabela).melhores(opcoes.k, pesos, **restricoes).to_string(index=False))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,162 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from painel.dados import (ARQUIVO_DADOS, FATOR_IQR, caminho_cache, gravar_artefato, impressao_digital, ler_artefato,
+                          limites_iqr)
+from painel.esboco import EsbocoQuantis
+
+#Remoção de outliers de várias colunas de uma vez. Os quartis de todas as
+#colunas (e de todos os grupos, quando por cidade) saem de uma única chamada
+#vetorizada sobre as mesmas linhas, e o filtro é uma única máscara booleana
+#combinada, sem cópias intermediárias do conjunto.
+#
+#Os limites calculados na carga ficam gravados ao lado do arquivo de dados e
+#são reaproveitados nos reinícios. Para os lotes acrescentados depois, os
+#limites são mantidos atualizados por esboços de quantis (EsbocosOutliers),
+#também gravados, que recebem cada lote
+
+#Colunas filtradas e fator do IQR usados pelo dashboard
+CAMPOS_OUTLIERS = ['area', 'total (R$)']
+#Limites por cidade (DASHBOARD_OUTLIERS_POR_CIDADE=1) ou globais
+POR_OUTLIERS = 'city' if os.environ.get('DASHBOARD_OUTLIERS_POR_CIDADE') == '1' else None
+#Identifica a configuração nos nomes dos arquivos derivados dela
+ASSINATURA_OUTLIERS = f'{POR_OUTLIERS or "global"}-{FATOR_IQR}'
+
+
+def quartis(dados, campos=CAMPOS_OUTLIERS, por=None):
+  #Primeiro e terceiro quartis de todas as colunas (por grupo, com "por") em
+  #uma única chamada: "<campo> q1" e "<campo> q3", uma linha por grupo
+  campos = list(campos)
+  if por is None:
+    #Direto no numpy, sem a sobrecarga do quantile do DataFrame
+    quantis = {campo: np.nanquantile(dados[campo].to_numpy(dtype=float), [0.25, 0.75]) for campo in campos}
+    return pd.DataFrame({f'{campo} q{numero}': [quantis[campo][posicao]]
+                         for campo in campos for numero, posicao in ((1, 0), (3, 1))})
+  quantis = dados.groupby(por, observed=True)[campos].quantile([0.25, 0.75]).unstack()
+  return pd.DataFrame({f'{campo} q{numero}': quantis[(campo, quantil)]
+                       for campo in campos for numero, quantil in ((1, 0.25), (3, 0.75))}).reset_index()
+
+
+class LimitesOutliers:
+  #Tabela com os limites inferior e superior de cada coluna, com uma linha
+  #por grupo (coluna "por") ou uma única linha para limites globais
+
+  def __init__(self, tabela, campos=CAMPOS_OUTLIERS, por=None):
+    self.tabela = tabela.reset_index(drop=True)
+    self.campos = list(campos)
+    self.por = por
+
+  @classmethod
+  def de_quartis(cls, quartis, campos=CAMPOS_OUTLIERS, por=None, fator=FATOR_IQR):
+    #A partir de uma tabela com "<campo> q1" e "<campo> q3" (e a coluna "por")
+    colunas = {por: quartis[por].to_numpy()} if por else {}
+    for campo in campos:
+      colunas[f'{campo} inferior'], colunas[f'{campo} superior'] = limites_iqr(
+        quartis[f'{campo} q1'].to_numpy(dtype=float), quartis[f'{campo} q3'].to_numpy(dtype=float), fator)
+    return cls(pd.DataFrame(colunas), campos, por)
+
+  @classmethod
+  def calcular(cls, dados, campos=CAMPOS_OUTLIERS, por=POR_OUTLIERS, fator=FATOR_IQR):
+    return cls.de_quartis(quartis(dados, campos, por), campos, por, fator)
+
+  def mascara(self, dados):
+    #Linhas dentro dos limites de todas as colunas. Linhas de grupos sem
+    #limites (ex.: uma cidade nova em um lote) ficam de fora
+    mascara = np.ones(len(dados), dtype=bool)
+    if self.por is not None:
+      #Posição do grupo de cada linha na tabela; -1 aponta para o NaN final.
+      #Em colunas categóricas, a busca é feita só nas categorias
+      grupos = pd.Index(self.tabela[self.por].astype(str))
+      serie = dados[self.por]
+      if isinstance(serie.dtype, pd.CategoricalDtype):
+        posicoes = np.append(grupos.get_indexer(serie.cat.categories.astype(str)), -1)[serie.cat.codes.to_numpy()]
+      else:
+        posicoes = grupos.get_indexer(serie.astype(str))
+    for campo in self.campos:
+      valores = dados[campo].to_numpy()
+      for lado in ('inferior', 'superior'):
+        limite = self.tabela[f'{campo} {lado}'].to_numpy(dtype=float)
+        limite = limite[0] if self.por is None else np.append(limite, np.nan)[posicoes]
+        mascara &= valores >= limite if lado == 'inferior' else valores <= limite
+    return mascara
+
+  def filtrar(self, dados):
+    return dados[self.mascara(dados)]
+
+
+class EsbocosOutliers:
+  #Esboços de quantis aproximados (EsbocoQuantis) de cada coluna, globais ou
+  #por grupo, alimentados com as linhas antes do filtro. Acrescentar um lote
+  #custa proporcional ao lote, e os limites saem dos quartis dos esboços. Um
+  #grupo que aparece pela primeira vez (ex.: uma cidade nova) ganha o próprio
+  #esboço
+
+  def __init__(self, campos=CAMPOS_OUTLIERS, por=None):
+    self.campos = list(campos)
+    self.por = por
+    #{(grupo, campo): EsbocoQuantis}, com grupo None para limites globais
+    self.esbocos = {}
+
+  @classmethod
+  def calcular(cls, dados, campos=CAMPOS_OUTLIERS, por=POR_OUTLIERS):
+    return cls(campos, por).adicionar(dados)
+
+  def adicionar(self, dados):
+    partes = [(None, dados)] if self.por is None else dados.groupby(self.por, observed=True)
+    for grupo, parte in partes:
+      grupo = None if grupo is None else str(grupo)
+      for campo in self.campos:
+        self.esbocos.setdefault((grupo, campo), EsbocoQuantis()).adicionar(parte[campo])
+    return self
+
+  def limites(self, fator=FATOR_IQR):
+    grupos = sorted({grupo for grupo, _ in self.esbocos}, key=str)
+    quartis = pd.DataFrame({self.por: grupos}) if self.por else pd.DataFrame(index=range(len(grupos)))
+    for campo in self.campos:
+      quartis[f'{campo} q1'] = [self.esbocos[grupo, campo].quantil(0.25) for grupo in grupos]
+      quartis[f'{campo} q3'] = [self.esbocos[grupo, campo].quantil(0.75) for grupo in grupos]
+    return LimitesOutliers.de_quartis(quartis, self.campos, self.por, fator)
+
+  def tabela(self):
+    #Uma linha por item guardado nos esboços (grupo, coluna, nível e valor)
+    partes = [pd.DataFrame({'grupo': grupo, 'campo': campo, 'nivel': nivel, 'valor': itens})
+              for (grupo, campo), esboco in self.esbocos.items() for nivel, itens in enumerate(esboco.niveis)]
+    return pd.concat(partes, ignore_index=True).astype({'grupo': 'string', 'nivel': 'int16'})
+
+  @classmethod
+  def de_tabela(cls, tabela, campos=CAMPOS_OUTLIERS, por=None):
+    esbocos = cls(campos, por)
+    for (grupo, campo), itens in tabela.groupby(['grupo', 'campo'], dropna=False, sort=False):
+      niveis = [itens.loc[itens['nivel'] == nivel, 'valor'].to_numpy() for nivel in range(itens['nivel'].max() + 1)]
+      esbocos.esbocos[None if pd.isna(grupo) else grupo, campo] = EsbocoQuantis.de_niveis(niveis)
+    return esbocos
+
+
+def caminho_limites(caminho=ARQUIVO_DADOS, impressao=None):
+  return caminho_cache(caminho, impressao or impressao_digital(caminho), f'limites-{ASSINATURA_OUTLIERS}')
+
+
+def ler_limites(caminho=ARQUIVO_DADOS, impressao=None):
+  #Limites gravados para esta versão do arquivo e esta configuração, ou None
+  tabela = ler_artefato(caminho_limites(caminho, impressao))
+  return LimitesOutliers(tabela, CAMPOS_OUTLIERS, POR_OUTLIERS) if tabela is not None else None
+
+
+def gravar_limites(limites, caminho=ARQUIVO_DADOS, impressao=None):
+  gravar_artefato(limites.tabela, caminho_limites(caminho, impressao))
+
+
+def caminho_esbocos(caminho=ARQUIVO_DADOS, impressao=None):
+  return caminho_cache(caminho, impressao or impressao_digital(caminho), f'esbocos-{ASSINATURA_OUTLIERS}')
+
+
+def ler_esbocos(caminho=ARQUIVO_DADOS, impressao=None):
+  #Esboços gravados para esta versão do arquivo e esta configuração, ou None
+  tabela = ler_artefato(caminho_esbocos(caminho, impressao))
+  return EsbocosOutliers.de_tabela(tabela, CAMPOS_OUTLIERS, POR_OUTLIERS) if tabela is not None else None
+
+
+def gravar_esbocos(esbocos, caminho=ARQUIVO_DADOS, impressao=None):
+  gravar_artefato(esbocos.tabela(), caminho_esbocos(caminho, impressao))
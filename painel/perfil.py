@@ -0,0 +1,61 @@
+import json
+import logging
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+#Instrumentação opcional do dashboard: tempo de cada seção e gráfico,
+#quantidade de linhas processadas e tamanho do JSON enviado ao navegador.
+#As medições vão para o log "painel.perfil" (uma linha JSON por medição) ao
+#final de cada rerun
+
+registro = logging.getLogger('painel.perfil')
+if not registro.handlers:
+  _saida = logging.StreamHandler()
+  _saida.setFormatter(logging.Formatter('%(asctime)s %(name)s %(message)s'))
+  registro.addHandler(_saida)
+  registro.setLevel(logging.INFO)
+  registro.propagate = False
+
+
+class Perfilador:
+
+  def __init__(self, ativo=False):
+    self.ativo = ativo
+    self.medicoes = []
+    self._figuras = {}
+    self._registradas = 0
+
+  @contextmanager
+  def medir(self, nome, tipo='seção', linhas=None, figura=None):
+    #Devolve a medição em andamento; a figura pode ser informada dentro do
+    #bloco (medicao['figura'] = ...) quando só é obtida durante a medição
+    medicao = {'tipo': tipo, 'nome': nome, 'tempo_ms': None, 'linhas': linhas, 'json_kb': None}
+    if not self.ativo:
+      yield medicao
+      return
+    inicio = time.perf_counter()
+    yield medicao
+    medicao['tempo_ms'] = round((time.perf_counter() - inicio) * 1000, 2)
+    figura = medicao.pop('figura', figura)
+    self.medicoes.append(medicao)
+    if figura is not None:
+      self._figuras[len(self.medicoes) - 1] = figura
+
+  def registrar(self):
+    #Calcula o tamanho do JSON das figuras (serialização extra, feita só no
+    #modo de perfil e depois das medições de tempo) e registra no log as
+    #medições ainda não registradas
+    for posicao, figura in self._figuras.items():
+      self.medicoes[posicao]['json_kb'] = round(len(figura.to_json()) / 1024, 1)
+    self._figuras = {}
+    for medicao in self.medicoes[self._registradas:]:
+      registro.info(json.dumps(medicao, ensure_ascii=False))
+    self._registradas = len(self.medicoes)
+
+  def publicar(self):
+    #Registra as medições restantes e devolve a tabela para o painel de
+    #depuração
+    self.registrar()
+    return pd.DataFrame(self.medicoes, columns=['tipo', 'nome', 'tempo_ms', 'linhas', 'json_kb'])
@@ -0,0 +1,284 @@
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import pickle
+import re
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import plotly.graph_objects as go
+
+from painel.agregacoes import agregados_de_grupos
+from painel.cidades import agregados_por_cidade
+from painel.dados import ARQUIVO_DADOS, DIRETORIO_CACHE, TIPOS_COLUNAS, TabelaDados, pyarrow
+from painel.graficos import FIGURAS, construir_figura, usar_tema_streamlit
+from painel.indice import COLUNAS_CATEGORICAS, IndiceFiltros
+from painel.ingestao import IngestaoIncremental
+from painel.outliers import ASSINATURA_OUTLIERS
+
+if pyarrow is not None:
+  import pyarrow.ipc
+
+#Pré-cálculo das tabelas-resumo e figuras do dashboard, fora das sessões:
+#
+#  python -m painel.precomputo --processos 4
+#
+#O resultado é um armazém em disco (um diretório por versão dos dados e
+#execução do pré-cálculo) que o dashboard abre na inicialização. As linhas e
+#tabelas ficam em arquivos Arrow sem compressão, lidos por mapeamento de
+#memória, de modo que várias réplicas do dashboard (e os processos do
+#pré-cálculo) compartilham as mesmas páginas do arquivo em vez de cada uma
+#refazer a carga e as agregações.
+#
+#São pré-calculadas a página sem filtros e cada cidade isolada; com --todas,
+#todas as combinações dos filtros categóricos (cidades x animais x mobília).
+#As faixas de quartos e de valor são contínuas e continuam calculadas sob
+#demanda pelo dashboard
+
+DIRETORIO_PRECOMPUTADO = os.environ.get('DASHBOARD_PRECOMPUTADO',
+                                        os.path.join(os.path.dirname(ARQUIVO_DADOS), DIRETORIO_CACHE, 'precomputado'))
+#Nome do diretório de um armazém: impressão do arquivo, versão dos lotes e
+#número da publicação (cada execução publica um diretório novo)
+NOME_ARMAZEM = re.compile(r'^(\w+)-(\d+)(?:\.(\d+))?$')
+#Formato do armazém, gravado no manifesto. Muda quando o conteúdo gravado
+#muda (2: o estado da ingestão inclui os esboços de outliers), para que um
+#armazém antigo seja ignorado em vez de restaurado pela metade
+FORMATO_ARMAZEM = 2
+
+
+def chave_filtros(filtros):
+  #Nome do diretório de uma combinação de filtros normalizada
+  return hashlib.sha1(repr(tuple(filtros)).encode('utf-8')).hexdigest()[:16]
+
+
+def gravar_tabela(dados, arquivo):
+  tabela = pyarrow.Table.from_pandas(dados)
+  with pyarrow.ipc.new_file(arquivo, tabela.schema) as saida:
+    saida.write_table(tabela)
+
+
+def ler_tabela(arquivo):
+  #Leitura por mapeamento de memória: as colunas numéricas apontam para as
+  #páginas do arquivo, compartilhadas entre os processos que o abrem
+  return pyarrow.ipc.open_file(pyarrow.memory_map(arquivo)).read_all().to_pandas(split_blocks=True)
+
+
+def combinacoes(indice, todas=False):
+  #Combinações de filtros pré-calculadas, já normalizadas como no dashboard
+  if not todas:
+    filtros = [{}] + [{'city': [cidade]} for cidade in indice.valores('city')]
+  else:
+    opcoes = []
+    for coluna in COLUNAS_CATEGORICAS:
+      valores = indice.valores(coluna)
+      subconjuntos = [list(selecao) for tamanho in range(1, len(valores) + 1)
+                      for selecao in itertools.combinations(valores, tamanho)]
+      opcoes.append([(coluna, selecao) for selecao in subconjuntos])
+    filtros = [dict(combinacao) for combinacao in itertools.product(*opcoes)]
+  return [tuple(indice.normalizar(filtro).items()) for filtro in filtros]
+
+
+class ArmazemPrecomputado:
+  #Leitura de um armazém gravado por precomputar()
+
+  def __init__(self, pasta):
+    self.pasta = pasta
+    with open(os.path.join(pasta, 'manifesto.json'), encoding='utf-8') as arquivo:
+      self.manifesto = json.load(arquivo)
+    self.impressao = self.manifesto['impressao']
+
+  def ingestao(self, lotes=None):
+    #Ingestão no mesmo estado do pré-cálculo, sem ler o CSV nem remover outliers
+    with open(os.path.join(self.pasta, 'estado.pkl'), 'rb') as arquivo:
+      estado = pickle.load(arquivo)
+    return IngestaoIncremental.restaurar(ler_tabela(os.path.join(self.pasta, 'dados.arrow')),
+                                         ler_tabela(os.path.join(self.pasta, 'grupos.arrow')), estado, lotes)
+
+  def _pasta_filtros(self, filtros):
+    chave = chave_filtros(filtros)
+    return os.path.join(self.pasta, chave) if chave in self.manifesto['combinacoes'] else None
+
+  def agregados(self, filtros):
+    #Tabelas-resumo da combinação de filtros, ou None se não foi pré-calculada.
+    #Os arquivos são abertos sob demanda: se o armazém foi removido por um
+    #pré-cálculo mais novo, devolve None e o dashboard volta a calcular
+    pasta = self._pasta_filtros(filtros)
+    if pasta is None:
+      return None
+    try:
+      with open(os.path.join(pasta, 'escalares.json'), encoding='utf-8') as arquivo:
+        agregados = json.load(arquivo)
+      for arquivo in os.listdir(os.path.join(pasta, 'agregados')):
+        agregados[os.path.splitext(arquivo)[0]] = ler_tabela(os.path.join(pasta, 'agregados', arquivo))
+    except FileNotFoundError:
+      return None
+    return agregados
+
+  def figura(self, filtros, nome):
+    #Figura pronta da combinação de filtros, ou None se não foi pré-calculada
+    pasta = self._pasta_filtros(filtros)
+    if pasta is None:
+      return None
+    try:
+      with open(os.path.join(pasta, 'figuras', f'{nome}.json'), encoding='utf-8') as arquivo:
+        return go.Figure(json.load(arquivo), skip_invalid=True)
+    except FileNotFoundError:
+      return None
+
+
+def publicacoes(diretorio, impressao_base):
+  #Armazéns publicados do arquivo de dados: (versão dos lotes, publicação,
+  #nome do diretório), do mais recente para o mais antigo
+  if not os.path.isdir(diretorio):
+    return []
+  encontrados = []
+  for nome in os.listdir(diretorio):
+    partes = NOME_ARMAZEM.match(nome)
+    if partes is not None and partes.group(1) == impressao_base:
+      encontrados.append((int(partes.group(2)), int(partes.group(3) or 0), nome))
+  return sorted(encontrados, reverse=True)
+
+
+def _abrir(pasta):
+  #Armazém no formato atual e calculado com a mesma regra de outliers, ou
+  #None (inclusive se foi removido enquanto era aberto)
+  try:
+    armazem = ArmazemPrecomputado(pasta)
+  except FileNotFoundError:
+    return None
+  atual = armazem.manifesto.get('formato') == FORMATO_ARMAZEM
+  return armazem if atual and armazem.manifesto.get('outliers') == ASSINATURA_OUTLIERS else None
+
+
+def abrir_armazem(impressao, diretorio=DIRETORIO_PRECOMPUTADO):
+  #Publicação mais recente da versão exata dos dados (impressão com a versão
+  #dos lotes)
+  if pyarrow is None:
+    return None
+  base, _, versao = impressao.rpartition('-')
+  for numero, _, nome in publicacoes(diretorio, base):
+    armazem = _abrir(os.path.join(diretorio, nome)) if str(numero) == versao else None
+    if armazem is not None:
+      return armazem
+  return None
+
+
+def ultimo_armazem(impressao_base, diretorio=DIRETORIO_PRECOMPUTADO):
+  #Armazém mais recente do arquivo de dados, qualquer que seja a versão dos
+  #lotes. Lotes que chegarem depois são acrescentados pela própria ingestão
+  if pyarrow is None:
+    return None
+  for _, _, nome in publicacoes(diretorio, impressao_base):
+    armazem = _abrir(os.path.join(diretorio, nome))
+    if armazem is not None:
+      return armazem
+  return None
+
+
+def verificar_armazem(pasta, lote):
+  #Verificação feita antes de publicar: a ingestão restaurada do armazém
+  #precisa aceitar um lote novo (as réplicas acrescentam os lotes que chegam
+  #depois do pré-cálculo) e unir as linhas restauradas às do lote
+  ingestao = ArmazemPrecomputado(pasta).ingestao()
+  ingestao.acrescentar(lote)
+  return len(ingestao.tabela)
+
+
+#Estado de cada processo do pré-cálculo, carregado uma vez por processo
+_estado = {}
+
+
+def _iniciar(pasta):
+  usar_tema_streamlit()
+  tabela = TabelaDados(ler_tabela(os.path.join(pasta, 'dados.arrow')))
+  _estado.update(pasta=pasta, tabela=tabela, indice=IndiceFiltros(tabela),
+                 grupos=ler_tabela(os.path.join(pasta, 'grupos.arrow')))
+
+
+def _calcular(filtros):
+  #Tabelas-resumo e figuras de uma combinação de filtros, como o dashboard
+  #as calcularia (sem filtros, a partir dos grupos da ingestão)
+  tabela = _estado['tabela']
+  if filtros:
+    tabela = tabela.filtrar(_estado['indice'].mascara(dict(filtros)))
+    if len(tabela) == 0:
+      return None
+    agregados = agregados_por_cidade(tabela)
+  else:
+    agregados = agregados_de_grupos(_estado['grupos'])
+
+  pasta = os.path.join(_estado['pasta'], chave_filtros(filtros))
+  os.makedirs(os.path.join(pasta, 'agregados'))
+  os.makedirs(os.path.join(pasta, 'figuras'))
+  escalares = {}
+  for nome, valor in agregados.items():
+    if isinstance(valor, pd.DataFrame):
+      gravar_tabela(valor, os.path.join(pasta, 'agregados', f'{nome}.arrow'))
+    else:
+      escalares[nome] = valor.item() if hasattr(valor, 'item') else valor
+  with open(os.path.join(pasta, 'escalares.json'), 'w', encoding='utf-8') as arquivo:
+    json.dump(escalares, arquivo)
+  for nome in FIGURAS:
+    with open(os.path.join(pasta, 'figuras', f'{nome}.json'), 'w', encoding='utf-8') as arquivo:
+      arquivo.write(construir_figura(nome, tabela, agregados).to_json())
+  return chave_filtros(filtros)
+
+
+def precomputar(caminho=ARQUIVO_DADOS, diretorio=DIRETORIO_PRECOMPUTADO, processos=None, todas=False, lotes=None):
+  if pyarrow is None:
+    raise RuntimeError('O pré-cálculo precisa do pyarrow instalado.')
+  ingestao = IngestaoIncremental.de_arquivo(caminho, lotes=lotes)
+  ingestao.atualizar()
+  #Cada execução publica um diretório novo: grava em um diretório temporário
+  #e o renomeia ao final, para que o dashboard nunca abra um armazém pela
+  #metade nem fique sem armazém enquanto um pré-cálculo roda
+  publicacao = time.time_ns()
+  destino = os.path.join(diretorio, f'{ingestao.impressao}.{publicacao}')
+  temporario = f'{destino}.{os.getpid()}.tmp'
+  shutil.rmtree(temporario, ignore_errors=True)
+  os.makedirs(temporario)
+  gravar_tabela(ingestao.tabela.colunas(*ingestao.tabela.nomes_colunas), os.path.join(temporario, 'dados.arrow'))
+  gravar_tabela(ingestao.grupos, os.path.join(temporario, 'grupos.arrow'))
+  with open(os.path.join(temporario, 'estado.pkl'), 'wb') as arquivo:
+    pickle.dump(ingestao.estado(), arquivo)
+
+  filtros = combinacoes(IndiceFiltros(ingestao.tabela), todas)
+  with ProcessPoolExecutor(processos, initializer=_iniciar, initargs=(temporario,)) as executor:
+    chaves = [chave for chave in executor.map(_calcular, filtros) if chave is not None]
+
+  with open(os.path.join(temporario, 'manifesto.json'), 'w', encoding='utf-8') as arquivo:
+    json.dump({'formato': FORMATO_ARMAZEM, 'impressao': ingestao.impressao, 'outliers': ASSINATURA_OUTLIERS,
+               'linhas': len(ingestao.tabela), 'combinacoes': chaves},
+              arquivo, ensure_ascii=False, indent=2)
+  verificar_armazem(temporario, ingestao.tabela.colunas(*TIPOS_COLUNAS).head(100))
+  os.replace(temporario, destino)
+  #Remove apenas as publicações anteriores do mesmo arquivo de dados: as de
+  #outros arquivos no mesmo diretório e as de um pré-cálculo mais novo
+  #continuam
+  for versao, numero, nome in publicacoes(diretorio, ingestao.impressao_base):
+    if (versao, numero) < (ingestao.versao, publicacao):
+      shutil.rmtree(os.path.join(diretorio, nome), ignore_errors=True)
+  return destino, len(chaves)
+
+
+def main(argumentos=None):
+  parser = argparse.ArgumentParser(description='Pré-calcula tabelas-resumo e figuras do dashboard.')
+  parser.add_argument('--arquivo', default=ARQUIVO_DADOS, help='CSV do conjunto de dados')
+  parser.add_argument('--destino', default=DIRETORIO_PRECOMPUTADO, help='diretório do armazém pré-calculado')
+  parser.add_argument('--processos', type=int, default=None, help='processos em paralelo (padrão: núcleos da máquina)')
+  parser.add_argument('--todas', action='store_true',
+                      help='todas as combinações dos filtros categóricos, e não apenas cada cidade isolada')
+  parser.add_argument('--lotes', help='pasta dos lotes de novos imóveis (padrão: a do arquivo de dados)')
+  opcoes = parser.parse_args(argumentos)
+
+  inicio = time.perf_counter()
+  destino, quantidade = precomputar(opcoes.arquivo, opcoes.destino, opcoes.processos, opcoes.todas, opcoes.lotes)
+  print(f'{quantidade} combinações de filtros pré-calculadas em {time.perf_counter() - inicio:.1f} s: {destino}')
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,23 @@
+import pandas as pd
+
+#Operações sobre DataFrames usadas por vários módulos (agregações, blocos,
+#ingestão). Não depende de nenhum outro módulo do painel, de modo que todos
+#podem importá-lo no topo
+
+
+def concatenar(partes):
+  #Concatena DataFrames mantendo as colunas categóricas (une as categorias
+  #antes, já que categorias diferentes fariam o pandas voltar para texto).
+  #As categorias de todas as partes passam antes para o tipo das da primeira
+  #(ex.: partes lidas de um arquivo Arrow têm categorias "str", e as criadas
+  #por adicionar_derivadas, "string")
+  partes = [parte for parte in partes if len(parte)] or partes[:1]
+  for coluna in partes[0].columns:
+    if isinstance(partes[0][coluna].dtype, pd.CategoricalDtype):
+      tipo = partes[0][coluna].cat.categories.dtype
+      series = [parte[coluna] if parte[coluna].cat.categories.dtype == tipo
+                else parte[coluna].cat.rename_categories(parte[coluna].cat.categories.astype(tipo))
+                for parte in partes]
+      categorias = pd.api.types.union_categoricals(series).categories
+      partes = [parte.assign(**{coluna: serie.cat.set_categories(categorias)}) for parte, serie in zip(partes, series)]
+  return pd.concat(partes, ignore_index=True)
@@ -0,0 +1,191 @@
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import quote, urlsplit
+
+import numpy as np
+
+#Teste de carga do serviço de agregados (painel.api): muitos clientes
+#simultâneos, cada um com uma conexão HTTP/1.1 persistente, repetindo
+#consultas com os filtros do dashboard durante um tempo fixo:
+#
+#  python -m painel.teste_carga --clientes 200 --duracao 10
+#  python -m painel.teste_carga --url http://127.0.0.1:8502 --condicional
+#
+#Sem --url, sobe uma instância local do serviço em uma porta livre e a
+#encerra no final. Os clientes são divididos entre alguns processos, para que
+#o próprio teste não fique limitado por um único interpretador. Antes da
+#medição, cada consulta é feita uma vez (sem isso, com --frio). Ao final,
+#mostra a vazão e as latências (p50, p90, p99 e máxima) das requisições
+
+CIDADES = ['São Paulo', 'Rio de Janeiro', 'Belo Horizonte', 'Porto Alegre', 'Campinas']
+#Consultas sorteadas pelos clientes: sem filtros, cada cidade e algumas
+#combinações com quartos, animais, mobília e valor total
+CONSULTAS = (
+  [''] + [f'city={quote(cidade)}' for cidade in CIDADES] +
+  [f'city={quote(cidade)}&rooms={quartos},{quartos}' for cidade in CIDADES for quartos in (1, 2, 3)] +
+  ['animal=acept', 'furniture=furnished', 'animal=acept&furniture=not%20furnished',
+   f'city={quote(CIDADES[0])},{quote(CIDADES[3])}&total=1000,5000']
+)
+
+
+def _cliente(url, prazo, condicional, semente, resultados):
+  #Um cliente: requisições em sequência na mesma conexão até o prazo
+  endereco = urlsplit(url)
+  aleatorio = random.Random(semente)
+  etags = {}
+  conexao = None
+  while time.monotonic() < prazo:
+    consulta = aleatorio.choice(CONSULTAS)
+    cabecalhos = {'Accept-Encoding': 'gzip'}
+    if condicional and consulta in etags:
+      cabecalhos['If-None-Match'] = etags[consulta]
+    inicio = time.perf_counter()
+    try:
+      if conexao is None:
+        conexao = http.client.HTTPConnection(endereco.hostname, endereco.port, timeout=30)
+      conexao.request('GET', f'/agregados?{consulta}', headers=cabecalhos)
+      resposta = conexao.getresponse()
+      corpo = resposta.read()
+    except (OSError, http.client.HTTPException):
+      resultados.append((time.perf_counter() - inicio, 'erro', 0))
+      if conexao is not None:
+        conexao.close()
+      conexao = None
+      continue
+    resultados.append((time.perf_counter() - inicio, resposta.status, len(corpo)))
+    if resposta.getheader('ETag'):
+      etags[consulta] = resposta.getheader('ETag')
+  if conexao is not None:
+    conexao.close()
+
+
+def _processo(url, clientes, duracao, condicional, semente):
+  #Roda "clientes" threads em um processo e devolve as medições delas
+  resultados = []
+  prazo = time.monotonic() + duracao
+  threads = [threading.Thread(target=_cliente, args=(url, prazo, condicional, semente + numero, resultados))
+             for numero in range(clientes)]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  return resultados
+
+
+def aquecer(url):
+  #Uma requisição de cada consulta antes da medição, para que ela reflita o
+  #serviço com as respostas já em cache (o caso comum em produção)
+  for consulta in CONSULTAS:
+    with urllib.request.urlopen(f'{url}/agregados?{consulta}', timeout=120) as resposta:
+      resposta.read()
+
+
+def executar(url, clientes=200, duracao=10.0, condicional=False, processos=None, semente=0):
+  processos = max(1, min(processos or min(4, os.cpu_count() or 1), clientes))
+  divisao = [clientes // processos + (1 if numero < clientes % processos else 0) for numero in range(processos)]
+  inicio = time.perf_counter()
+  with ProcessPoolExecutor(processos) as executor:
+    partes = executor.map(_processo, [url] * processos, divisao, [duracao] * processos, [condicional] * processos,
+                          [semente + 100_000 * numero for numero in range(processos)])
+    resultados = [resultado for parte in partes for resultado in parte]
+  tempo = time.perf_counter() - inicio
+
+  latencias = np.array([latencia for latencia, status, _ in resultados if status != 'erro']) * 1000
+  situacoes = {}
+  for _, status, _ in resultados:
+    situacoes[str(status)] = situacoes.get(str(status), 0) + 1
+  percentis = np.percentile(latencias, [50, 90, 99]) if len(latencias) else [float('nan')] * 3
+  return {
+    'clientes': clientes,
+    'processos': processos,
+    'duracao_s': tempo,
+    'requisicoes': len(resultados),
+    'vazao_rps': len(latencias) / tempo,
+    'p50_ms': float(percentis[0]),
+    'p90_ms': float(percentis[1]),
+    'p99_ms': float(percentis[2]),
+    'max_ms': float(latencias.max()) if len(latencias) else float('nan'),
+    'mb_recebidos': sum(tamanho for _, _, tamanho in resultados) / 2 ** 20,
+    'status': situacoes,
+  }
+
+
+def _porta_livre():
+  with socket.socket() as soquete:
+    soquete.bind(('127.0.0.1', 0))
+    return soquete.getsockname()[1]
+
+
+def iniciar_servico(arquivo=None, espera=120, lotes=None):
+  #Sobe o serviço em outro processo e espera ele responder em /saude
+  porta = _porta_livre()
+  comando = [sys.executable, '-m', 'painel.api', '--porta', str(porta)]
+  if arquivo:
+    comando += ['--arquivo', arquivo]
+  if lotes:
+    comando += ['--lotes', lotes]
+  processo = subprocess.Popen(comando, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+  url = f'http://127.0.0.1:{porta}'
+  limite = time.monotonic() + espera
+  while time.monotonic() < limite:
+    if processo.poll() is not None:
+      raise RuntimeError('O serviço de agregados terminou antes de responder.')
+    try:
+      with urllib.request.urlopen(f'{url}/saude', timeout=1):
+        return processo, url
+    except OSError:
+      time.sleep(0.2)
+  processo.terminate()
+  raise RuntimeError('O serviço de agregados não respondeu a tempo.')
+
+
+def main(argumentos=None):
+  parser = argparse.ArgumentParser(description='Teste de carga do serviço de agregados (painel.api).')
+  parser.add_argument('--url', help='serviço já em execução (padrão: sobe uma instância local)')
+  parser.add_argument('--arquivo', help='CSV do conjunto de dados da instância local')
+  parser.add_argument('--lotes', help='pasta dos lotes de novos imóveis da instância local')
+  parser.add_argument('--clientes', type=int, default=200, help='clientes simultâneos')
+  parser.add_argument('--duracao', type=float, default=10.0, help='duração do teste, em segundos')
+  parser.add_argument('--processos', type=int, default=None, help='processos que dividem os clientes (padrão: até 4)')
+  parser.add_argument('--condicional', action='store_true',
+                      help='reenvia o ETag recebido (If-None-Match), como um cliente com cache')
+  parser.add_argument('--frio', action='store_true', help='mede também o cálculo das respostas ainda fora do cache')
+  parser.add_argument('--saida', help='arquivo JSON com o resultado')
+  opcoes = parser.parse_args(argumentos)
+
+  processo = None
+  url = opcoes.url
+  if url is None:
+    processo, url = iniciar_servico(opcoes.arquivo, lotes=opcoes.lotes)
+  try:
+    if not opcoes.frio:
+      aquecer(url)
+    resultado = executar(url, opcoes.clientes, opcoes.duracao, opcoes.condicional, opcoes.processos)
+  finally:
+    if processo is not None:
+      processo.terminate()
+      processo.wait()
+
+  print(f'{resultado["clientes"]} clientes em {resultado["processos"]} processos, {resultado["duracao_s"]:.1f} s: '
+        f'{resultado["requisicoes"]:,} requisições')
+  print(f'vazão: {resultado["vazao_rps"]:,.0f} req/s   recebidos: {resultado["mb_recebidos"]:.1f} MB')
+  print(f'latência (ms): p50 {resultado["p50_ms"]:.1f}   p90 {resultado["p90_ms"]:.1f}   '
+        f'p99 {resultado["p99_ms"]:.1f}   máx {resultado["max_ms"]:.1f}')
+  print('status: ' + '   '.join(f'{status}: {quantidade:,}' for status, quantidade in sorted(resultado['status'].items())))
+  if opcoes.saida:
+    with open(opcoes.saida, 'w', encoding='utf-8') as arquivo:
+      json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+  main()